@@ -1 +1,12 @@
-from py4D_browser.main_window import DataViewer
+def __getattr__(name):
+    # DataViewer is imported on first use, so that worker processes which
+    # only need the I/O helpers don't have to load Qt and py4DSTEM
+    if name == "DataViewer":
+        from py4D_browser.main_window import DataViewer
+
+        return DataViewer
+    if name == "show":
+        from py4D_browser.runGUI import show
+
+        return show
+    raise AttributeError(f"module 'py4D_browser' has no attribute {name!r}")
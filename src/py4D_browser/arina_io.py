@@ -0,0 +1,191 @@
+import numpy as np
+import h5py
+import os
+import copy
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import importlib
+
+HAS_BITSHUFFLE = importlib.util.find_spec("bitshuffle") is not None
+if HAS_BITSHUFFLE:
+    import bitshuffle
+
+# HDF5 filter id and compression option of bitshuffle with LZ4
+BITSHUFFLE_FILTER = 32008
+BITSHUFFLE_LZ4 = 2
+
+
+class ArinaChunkReader:
+    """
+    Lazy 4D view of an Arina master file. Opening only records where each
+    frame's compressed chunk lives in the data files; frames are read with
+    pread and decompressed on demand on a thread pool, and decoded frames are
+    kept in an LRU cache. When bitshuffle is not installed, or the chunks use
+    some other filter, frames are read through h5py instead.
+    """
+
+    def __init__(self, filepath, scan_shape=None, cache_bytes=256 * 2**20):
+        self.file = h5py.File(filepath, "r")
+        datasets = [self.file["entry"]["data"][k] for k in self.file["entry"]["data"]]
+
+        self.frame_shape = datasets[0].shape[1:]
+        self.dtype = datasets[0].dtype
+        n_frames = sum(d.shape[0] for d in datasets)
+
+        if scan_shape is None:
+            # Arina scans are usually square; otherwise the user can reshape
+            N = int(np.round(np.sqrt(n_frames)))
+            scan_shape = (N, N) if N * N == n_frames else (1, n_frames)
+        self.scan_shape = tuple(scan_shape)
+        assert np.prod(self.scan_shape) == n_frames, "Scan shape does not match"
+
+        # For every frame, the dataset holding it and its index there
+        self.datasets = datasets
+        self.frame_dataset = np.repeat(
+            np.arange(len(datasets)), [d.shape[0] for d in datasets]
+        )
+        self.frame_local = np.concatenate([np.arange(d.shape[0]) for d in datasets])
+
+        self.direct = HAS_BITSHUFFLE and all(
+            is_bitshuffle_lz4(d) and d.chunks == (1, *self.frame_shape)
+            for d in datasets
+        )
+        if self.direct:
+            self.chunk_offsets, self.chunk_sizes = index_chunks(datasets)
+            self.fds = [os.open(d.file.filename, os.O_RDONLY) for d in datasets]
+
+        self.cache = OrderedDict()
+        self.cache_frames = max(1, cache_bytes // self.frame_nbytes)
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor()
+
+    @property
+    def shape(self):
+        return self.scan_shape + tuple(self.frame_shape)
+
+    @property
+    def ndim(self):
+        return 4
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def frame_nbytes(self):
+        return int(np.prod(self.frame_shape)) * self.dtype.itemsize
+
+    def __len__(self):
+        return self.scan_shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        return self[...] if dtype is None else self[...].astype(dtype)
+
+    def reshape(self, *shape):
+        # A view with another scan shape, sharing the index and cache
+        assert tuple(shape[2:]) == tuple(self.frame_shape), "Cannot reshape frames"
+        assert np.prod(shape[:2]) == np.prod(self.scan_shape), "Wrong scan size"
+        reshaped = copy.copy(self)
+        reshaped.scan_shape = tuple(shape[:2])
+        return reshaped
+
+    def read_frame(self, index):
+        with self.lock:
+            if index in self.cache:
+                self.cache.move_to_end(index)
+                return self.cache[index]
+
+        d = self.frame_dataset[index]
+        if self.direct:
+            offset, nbytes = self.chunk_offsets[index], self.chunk_sizes[index]
+            if nbytes == 0:
+                # chunks that were never written read as zeros
+                return np.zeros(self.frame_shape, dtype=self.dtype)
+            frame = decode_bitshuffle_chunk(
+                os.pread(self.fds[d], nbytes, offset), self.frame_shape, self.dtype
+            )
+        else:
+            with self.lock:
+                frame = self.datasets[d][self.frame_local[index]]
+
+        with self.lock:
+            self.cache[index] = frame
+            while len(self.cache) > self.cache_frames:
+                self.cache.popitem(last=False)
+        return frame
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            i = key.index(Ellipsis)
+            key = key[:i] + (slice(None),) * (5 - len(key)) + key[i + 1 :]
+        key = key + (slice(None),) * (4 - len(key))
+
+        rx = np.arange(self.scan_shape[0])[key[0]]
+        ry = np.arange(self.scan_shape[1])[key[1]]
+        frames = np.ravel(rx)[:, None] * self.scan_shape[1] + np.ravel(ry)[None, :]
+
+        # Decompress the frames in parallel, then cut out the detector region
+        decoded = list(self.pool.map(self.read_frame, frames.ravel()))
+        stack = np.stack(decoded).reshape(*frames.shape, *self.frame_shape)
+        return stack[(slice(None), slice(None)) + key[2:]].reshape(
+            np.shape(rx) + np.shape(ry) + stack[0, 0][key[2:]].shape
+        )
+
+    def close(self):
+        if self.direct:
+            for fd in self.fds:
+                os.close(fd)
+            self.direct = False
+        self.pool.shutdown(wait=False)
+
+
+def is_bitshuffle_lz4(dset):
+    plist = dset.id.get_create_plist()
+    for i in range(plist.get_nfilters()):
+        code, _, values, _ = plist.get_filter(i)
+        if code == BITSHUFFLE_FILTER and len(values) > 4:
+            return values[4] == BITSHUFFLE_LZ4
+    return False
+
+
+def index_chunks(datasets):
+    # File offset and size of each frame's chunk, in frame order
+    offsets, sizes = [], []
+    for dset in datasets:
+        dset_offsets = np.zeros(dset.shape[0], dtype=np.int64)
+        dset_sizes = np.zeros(dset.shape[0], dtype=np.int64)
+
+        def record(info):
+            dset_offsets[info.chunk_offset[0]] = info.byte_offset
+            dset_sizes[info.chunk_offset[0]] = info.size
+
+        if hasattr(dset.id, "chunk_iter"):
+            dset.id.chunk_iter(record)
+        else:
+            for i in range(dset.id.get_num_chunks()):
+                record(dset.id.get_chunk_info(i))
+        offsets.append(dset_offsets)
+        sizes.append(dset_sizes)
+    return np.concatenate(offsets), np.concatenate(sizes)
+
+
+def decode_bitshuffle_chunk(buffer, shape, dtype):
+    # The HDF5 bitshuffle filter prefixes each chunk with its uncompressed
+    # size (uint64) and block size in bytes (uint32), both big-endian
+    block_size = int.from_bytes(buffer[8:12], "big") // dtype.itemsize
+    return bitshuffle.decompress_lz4(
+        np.frombuffer(buffer, dtype=np.uint8, offset=12), shape, dtype, block_size
+    )
+
+
+def find_arina_calibrations(filepath):
+    # Scan step from the metadata file written next to the master file
+    try:
+        with h5py.File(f"{filepath[:-10]}.h5", "r") as f:
+            pixel_size = f["STEM Metadata"].attrs["Pixel Size"][0]
+        return pixel_size * 10, "A"
+    except Exception:
+        return 1.0, "pixels"
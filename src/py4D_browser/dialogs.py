@@ -1,10 +1,13 @@
 from py4DSTEM import DataCube, data
 import pyqtgraph as pg
 import numpy as np
+import scipy.fft
+import weakref
+from functools import partial
 from tqdm import tqdm
 from PyQt5.QtWidgets import QFrame, QPushButton, QApplication, QLabel
 from PyQt5.QtCore import pyqtSignal
-from PyQt5.QtCore import Qt, QObject
+from PyQt5.QtCore import Qt, QObject, QTimer
 from PyQt5.QtGui import QDoubleValidator
 from PyQt5.QtWidgets import (
     QDialog,
@@ -16,8 +19,15 @@ from PyQt5.QtWidgets import (
     QGroupBox,
     QGridLayout,
     QCheckBox,
+    QSlider,
+    QFileDialog,
+)
+from py4D_browser.utils import (
+    make_detector,
+    gather_images,
+    shift_phase_ramp,
+    StatusBarWriter,
 )
-from py4D_browser.utils import make_detector, StatusBarWriter
 
 
 class ResizeDialog(QDialog):
@@ -106,16 +116,18 @@ class ResizeDialog(QDialog):
         self.new_size = [x_new, y_new]
 
     def get_next_rect(self, current, direction):
-        # get the next perfect rectangle
-        iterator = (
-            range(current, 0, -1) if direction == "down" else range(current, self.N + 1)
-        )
+        return get_next_rect(self.N, current, direction)
+
+
+def get_next_rect(N, current, direction):
+    # get the next perfect rectangle
+    iterator = range(current, 0, -1) if direction == "down" else range(current, N + 1)
 
-        for i in iterator:
-            if self.N % i == 0:
-                return i, self.N // i
+    for i in iterator:
+        if N % i == 0:
+            return i, N // i
 
-        raise ValueError("Factor finding failed, frustratingly.")
+    raise ValueError("Factor finding failed, frustratingly.")
 
 
 class CalibrateDialog(QDialog):
@@ -285,12 +297,651 @@ class CalibrateDialog(QDialog):
         self.close()
 
 
+class CompressionDialog(QDialog):
+    def __init__(self, codecs, shape, parent=None):
+        super().__init__(parent=parent)
+
+        # codecs maps names to (default level, max level), with None for
+        # codecs that have no level setting
+        self.codecs = codecs
+        self.options = None
+
+        layout = QVBoxLayout(self)
+
+        params_box = QGroupBox("HDF5 Storage")
+        layout.addWidget(params_box)
+
+        params_layout = QGridLayout()
+        params_box.setLayout(params_layout)
+
+        params_layout.addWidget(QLabel("Compression"), 0, 0, Qt.AlignRight)
+        self.codec_box = QComboBox()
+        self.codec_box.addItems(list(codecs.keys()))
+        params_layout.addWidget(self.codec_box, 0, 1)
+
+        params_layout.addWidget(QLabel("Level"), 1, 0, Qt.AlignRight)
+        self.level_box = QSpinBox()
+        params_layout.addWidget(self.level_box, 1, 1)
+
+        params_layout.addWidget(QLabel("Chunk Shape"), 2, 0, Qt.AlignRight)
+        chunk_layout = QHBoxLayout()
+        self.chunk_boxes = []
+        for n in shape:
+            box = QSpinBox()
+            box.setRange(1, n)
+            chunk_layout.addWidget(box)
+            self.chunk_boxes.append(box)
+        # default to one chunk per diffraction pattern
+        for box, n in zip(self.chunk_boxes, (1, 1, *shape[2:])):
+            box.setValue(n)
+        params_layout.addLayout(chunk_layout, 2, 1)
+
+        button_layout = QHBoxLayout()
+        button_layout.addStretch()
+        cancel_button = QPushButton("Cancel")
+        cancel_button.pressed.connect(self.close)
+        button_layout.addWidget(cancel_button)
+        done_button = QPushButton("Save")
+        done_button.pressed.connect(self.set_and_close)
+        button_layout.addWidget(done_button)
+        layout.addLayout(button_layout)
+
+        self.codec_box.currentTextChanged.connect(self.codec_changed)
+        self.codec_changed(self.codec_box.currentText())
+
+    @classmethod
+    def get_options(cls, codecs, shape, parent=None):
+        dialog = cls(codecs=codecs, shape=shape, parent=parent)
+        dialog.exec_()
+        return dialog.options
+
+    def codec_changed(self, codec):
+        levels = self.codecs[codec]
+        self.level_box.setEnabled(levels is not None)
+        if levels is not None:
+            self.level_box.setRange(0, levels[1])
+            self.level_box.setValue(levels[0])
+
+    def set_and_close(self):
+        self.options = {
+            "codec": self.codec_box.currentText(),
+            "level": self.level_box.value(),
+            "chunks": tuple(box.value() for box in self.chunk_boxes),
+        }
+        self.close()
+
+
+class BinDialog(QDialog):
+    OUTPUT_DTYPES = ["float32", "float64", "uint16", "uint32"]
+
+    # Load Data Binned used to always bin diffraction space by 4
+    DEFAULT_DIFFRACTION_BIN = 4
+
+    # Whether the output type defaults to the input's while nothing is binned
+    KEEP_DTYPE_UNBINNED = False
+
+    def __init__(self, shape, dtype, parent=None, button_text="Load"):
+        super().__init__(parent=parent)
+
+        self.shape = shape
+        self.dtype = np.dtype(dtype)
+        self.options = None
+
+        layout = QVBoxLayout(self)
+
+        self.add_region_box(layout)
+
+        binning_box = QGroupBox("Binning")
+        layout.addWidget(binning_box)
+
+        binning_layout = QGridLayout()
+        binning_box.setLayout(binning_layout)
+
+        binning_layout.addWidget(QLabel("Scan"), 0, 0, Qt.AlignRight)
+        self.scan_bin_box = QSpinBox()
+        self.scan_bin_box.setRange(1, min(shape[:2]))
+        binning_layout.addWidget(self.scan_bin_box, 0, 1)
+
+        binning_layout.addWidget(QLabel("Diffraction"), 1, 0, Qt.AlignRight)
+        self.diffraction_bin_box = QSpinBox()
+        self.diffraction_bin_box.setRange(1, min(shape[2:]))
+        self.diffraction_bin_box.setValue(self.DEFAULT_DIFFRACTION_BIN)
+        binning_layout.addWidget(self.diffraction_bin_box, 1, 1)
+
+        binning_layout.addWidget(QLabel("Combine By"), 2, 0, Qt.AlignRight)
+        self.reduce_box = QComboBox()
+        self.reduce_box.addItems(["Sum", "Mean"])
+        binning_layout.addWidget(self.reduce_box, 2, 1)
+
+        binning_layout.addWidget(QLabel("Output Type"), 3, 0, Qt.AlignRight)
+        self.dtype_box = QComboBox()
+        self.dtype_box.addItems(self.OUTPUT_DTYPES)
+        self.dtype_box.addItem(f"Same as input ({self.dtype.name})")
+        binning_layout.addWidget(self.dtype_box, 3, 1)
+
+        # the default follows the binning until a type is picked
+        self.dtype_picked = False
+        self.dtype_box.activated.connect(self.pick_dtype)
+        self.scan_bin_box.valueChanged.connect(self.update_default_dtype)
+        self.diffraction_bin_box.valueChanged.connect(self.update_default_dtype)
+        self.update_default_dtype()
+
+        button_layout = QHBoxLayout()
+        button_layout.addStretch()
+        cancel_button = QPushButton("Cancel")
+        cancel_button.pressed.connect(self.close)
+        button_layout.addWidget(cancel_button)
+        done_button = QPushButton(button_text)
+        done_button.pressed.connect(self.set_and_close)
+        button_layout.addWidget(done_button)
+        layout.addLayout(button_layout)
+
+    @classmethod
+    def get_options(cls, shape, dtype, parent=None):
+        dialog = cls(shape=shape, dtype=dtype, parent=parent)
+        dialog.exec_()
+        return dialog.options
+
+    def pick_dtype(self):
+        self.dtype_picked = True
+
+    def update_default_dtype(self):
+        if self.dtype_picked:
+            return
+        unbinned = self.scan_bin_box.value() == self.diffraction_bin_box.value() == 1
+        if self.KEEP_DTYPE_UNBINNED and unbinned:
+            self.dtype_box.setCurrentIndex(self.dtype_box.count() - 1)
+        else:
+            self.dtype_box.setCurrentIndex(0)
+
+    def add_region_box(self, layout):
+        # The whole dataset is binned
+        pass
+
+    def get_region(self):
+        return tuple(slice(0, n) for n in self.shape)
+
+    def set_and_close(self):
+        # the input dtype is kept through binning, with integer sums clipped
+        dtype = self.dtype_box.currentText()
+        if dtype.startswith("Same as input"):
+            dtype = self.dtype
+        self.options = {
+            "region": self.get_region(),
+            "scan_bin": self.scan_bin_box.value(),
+            "diffraction_bin": self.diffraction_bin_box.value(),
+            "reduce": self.reduce_box.currentText().lower(),
+            "dtype": np.dtype(dtype),
+        }
+        self.close()
+
+
+class LoadRegionDialog(BinDialog):
+    DEFAULT_DIFFRACTION_BIN = 1
+
+    # so that memory scales with the region alone
+    KEEP_DTYPE_UNBINNED = True
+
+    def add_region_box(self, layout):
+        region_box = QGroupBox("Region")
+        layout.addWidget(region_box)
+
+        region_layout = QGridLayout()
+        region_box.setLayout(region_layout)
+
+        region_layout.addWidget(QLabel("Start"), 0, 1)
+        region_layout.addWidget(QLabel("Stop"), 0, 2)
+
+        # one row of start/stop boxes per axis, stop being exclusive
+        self.bound_boxes = []
+        axis_names = ["Scan X", "Scan Y", "Diffraction X", "Diffraction Y"]
+        for row, (name, n) in enumerate(zip(axis_names, self.shape), start=1):
+            region_layout.addWidget(QLabel(f"{name} [{n}]"), row, 0, Qt.AlignRight)
+            start_box = QSpinBox()
+            start_box.setRange(0, n - 1)
+            stop_box = QSpinBox()
+            stop_box.setRange(1, n)
+            stop_box.setValue(n)
+            region_layout.addWidget(start_box, row, 1)
+            region_layout.addWidget(stop_box, row, 2)
+            self.bound_boxes.append((start_box, stop_box))
+
+    def get_region(self):
+        return tuple(
+            slice(start.value(), max(stop.value(), start.value() + 1))
+            for start, stop in self.bound_boxes
+        )
+
+
+class DatasetPickerDialog(QDialog):
+    def __init__(self, entries, parent=None):
+        super().__init__(parent=parent)
+
+        self.entries = entries
+        self.dataset = None
+
+        layout = QVBoxLayout(self)
+
+        layout.addWidget(QLabel("This file holds several datasets. Choose one:"))
+
+        self.dataset_box = QComboBox()
+        for entry in entries:
+            shape = " × ".join(str(n) for n in entry["shape"])
+            chunks = "contiguous" if entry["chunks"] is None else entry["chunks"]
+            self.dataset_box.addItem(
+                f"{entry['name']}  [{shape}, {entry['dtype']}, {chunks}]"
+            )
+        layout.addWidget(self.dataset_box)
+
+        button_layout = QHBoxLayout()
+        button_layout.addStretch()
+        cancel_button = QPushButton("Cancel")
+        cancel_button.pressed.connect(self.close)
+        button_layout.addWidget(cancel_button)
+        done_button = QPushButton("Load")
+        done_button.pressed.connect(self.set_and_close)
+        button_layout.addWidget(done_button)
+        layout.addLayout(button_layout)
+
+    @classmethod
+    def get_dataset(cls, entries, parent=None):
+        dialog = cls(entries=entries, parent=parent)
+        dialog.exec_()
+        return dialog.dataset
+
+    def set_and_close(self):
+        self.dataset = self.entries[self.dataset_box.currentIndex()]
+        self.close()
+
+
+class RawBinaryDialog(QDialog):
+    DTYPES = [
+        "float32",
+        "float64",
+        "uint8",
+        "uint16",
+        "uint32",
+        "uint64",
+        "int8",
+        "int16",
+        "int32",
+        "int64",
+    ]
+    BYTE_ORDERS = {"Little endian": "<", "Big endian": ">"}
+
+    def __init__(self, file_size, parent=None):
+        super().__init__(parent=parent)
+
+        self.file_size = file_size
+        self.options = None
+
+        layout = QVBoxLayout(self)
+
+        layout_box = QGroupBox("File Layout (bytes)")
+        layout.addWidget(layout_box)
+        file_layout = QGridLayout()
+        layout_box.setLayout(file_layout)
+
+        self.offset_box = QSpinBox()
+        self.frame_header_box = QSpinBox()
+        self.frame_padding_box = QSpinBox()
+        for row, (label, box) in enumerate(
+            [
+                ("File Header", self.offset_box),
+                ("Frame Header", self.frame_header_box),
+                ("Frame Padding", self.frame_padding_box),
+            ]
+        ):
+            file_layout.addWidget(QLabel(label), row, 0, Qt.AlignRight)
+            box.setRange(0, min(file_size, 2**31 - 1))
+            box.setKeyboardTracking(False)
+            box.valueChanged.connect(self.layout_changed)
+            file_layout.addWidget(box, row, 1)
+
+        data_box = QGroupBox("Data")
+        layout.addWidget(data_box)
+        data_layout = QGridLayout()
+        data_box.setLayout(data_layout)
+
+        data_layout.addWidget(QLabel("Data Type"), 0, 0, Qt.AlignRight)
+        self.dtype_box = QComboBox()
+        self.dtype_box.addItems(self.DTYPES)
+        self.dtype_box.currentTextChanged.connect(self.layout_changed)
+        data_layout.addWidget(self.dtype_box, 0, 1)
+
+        data_layout.addWidget(QLabel("Byte Order"), 1, 0, Qt.AlignRight)
+        self.byte_order_box = QComboBox()
+        self.byte_order_box.addItems(list(self.BYTE_ORDERS.keys()))
+        data_layout.addWidget(self.byte_order_box, 1, 1)
+
+        shape_box = QGroupBox("Shape")
+        layout.addWidget(shape_box)
+        shape_layout = QGridLayout()
+        shape_box.setLayout(shape_layout)
+
+        shape_layout.addWidget(QLabel("Detector"), 0, 0, Qt.AlignRight)
+        self.frame_boxes = []
+        for column in (1, 2):
+            box = QSpinBox()
+            box.setRange(1, 2**16)
+            box.setValue(128)
+            box.setKeyboardTracking(False)
+            box.valueChanged.connect(self.layout_changed)
+            shape_layout.addWidget(box, 0, column)
+            self.frame_boxes.append(box)
+
+        # the scan boxes step through the factorizations of the frame count
+        shape_layout.addWidget(QLabel("Scan"), 1, 0, Qt.AlignRight)
+        self.x_box = QSpinBox()
+        self.x_box.setKeyboardTracking(False)
+        self.x_box.valueChanged.connect(self.x_box_changed)
+        shape_layout.addWidget(self.x_box, 1, 1)
+        self.y_box = QSpinBox()
+        self.y_box.setKeyboardTracking(False)
+        self.y_box.valueChanged.connect(self.y_box_changed)
+        shape_layout.addWidget(self.y_box, 1, 2)
+
+        self.frames_label = QLabel()
+        shape_layout.addWidget(self.frames_label, 2, 0, 1, 3)
+
+        button_layout = QHBoxLayout()
+        button_layout.addStretch()
+        cancel_button = QPushButton("Cancel")
+        cancel_button.pressed.connect(self.close)
+        button_layout.addWidget(cancel_button)
+        self.done_button = QPushButton("Load")
+        self.done_button.pressed.connect(self.set_and_close)
+        button_layout.addWidget(self.done_button)
+        layout.addLayout(button_layout)
+
+        self.layout_changed()
+
+    @classmethod
+    def get_options(cls, file_size, parent=None):
+        dialog = cls(file_size=file_size, parent=parent)
+        dialog.exec_()
+        return dialog.options
+
+    def frame_stride(self):
+        Qx, Qy = (box.value() for box in self.frame_boxes)
+        return (
+            self.frame_header_box.value()
+            + Qx * Qy * np.dtype(self.dtype_box.currentText()).itemsize
+            + self.frame_padding_box.value()
+        )
+
+    def layout_changed(self, *args):
+        # Count the whole frames in the file and reset the scan shape to
+        # square if possible
+        stride = self.frame_stride()
+        self.N = max(0, self.file_size - self.offset_box.value()) // stride
+        leftover = self.file_size - self.offset_box.value() - self.N * stride
+        self.frames_label.setText(
+            f"{self.N} frames" + (f", {leftover} bytes left over" if leftover else "")
+        )
+        self.done_button.setEnabled(self.N > 0)
+
+        Nmax = max(self.N, 1)
+        N_square = int(np.round(np.sqrt(Nmax)))
+        x, y = (N_square, N_square) if N_square**2 == Nmax else (1, Nmax)
+        for box, value in ((self.x_box, x), (self.y_box, y)):
+            box.blockSignals(True)
+            box.setRange(1, Nmax)
+            box.setValue(value)
+            box.blockSignals(False)
+        self.x_box_last, self.y_box_last = x, y
+
+    def x_box_changed(self, new_value):
+        if new_value == self.x_box_last:
+            return
+        x_new, y_new = get_next_rect(
+            self.N, new_value, "down" if new_value < self.x_box_last else "up"
+        )
+        self.set_scan_shape(x_new, y_new)
+
+    def y_box_changed(self, new_value):
+        if new_value == self.y_box_last:
+            return
+        y_new, x_new = get_next_rect(
+            self.N, new_value, "down" if new_value < self.y_box_last else "up"
+        )
+        self.set_scan_shape(x_new, y_new)
+
+    def set_scan_shape(self, x, y):
+        self.x_box_last = x
+        self.y_box_last = y
+        self.x_box.setValue(x)
+        self.y_box.setValue(y)
+
+    def set_and_close(self):
+        byte_order = self.BYTE_ORDERS[self.byte_order_box.currentText()]
+        self.options = {
+            "offset": self.offset_box.value(),
+            "frame_header": self.frame_header_box.value(),
+            "frame_padding": self.frame_padding_box.value(),
+            "dtype": np.dtype(self.dtype_box.currentText()).newbyteorder(byte_order),
+            "frame_shape": tuple(box.value() for box in self.frame_boxes),
+            "scan_shape": (self.x_box.value(), self.y_box.value()),
+        }
+        self.close()
+
+
+class LiveAcquisitionDialog(QDialog):
+    SOURCES = ["Raw File", "HDF5 File", "Socket"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent=parent)
+
+        self.options = None
+
+        layout = QVBoxLayout(self)
+
+        source_box = QGroupBox("Source")
+        layout.addWidget(source_box)
+        source_layout = QGridLayout()
+        source_box.setLayout(source_layout)
+
+        source_layout.addWidget(QLabel("Type"), 0, 0, Qt.AlignRight)
+        self.source_box = QComboBox()
+        self.source_box.addItems(self.SOURCES)
+        self.source_box.currentTextChanged.connect(self.source_changed)
+        source_layout.addWidget(self.source_box, 0, 1)
+
+        self.path_label = QLabel("File")
+        source_layout.addWidget(self.path_label, 1, 0, Qt.AlignRight)
+        path_layout = QHBoxLayout()
+        self.path_box = QLineEdit()
+        path_layout.addWidget(self.path_box)
+        self.browse_button = QPushButton("Browse...")
+        self.browse_button.pressed.connect(self.browse)
+        path_layout.addWidget(self.browse_button)
+        source_layout.addLayout(path_layout, 1, 1)
+
+        # Frame format, which HDF5 files describe themselves
+        self.format_box = QGroupBox("Frames")
+        layout.addWidget(self.format_box)
+        format_layout = QGridLayout()
+        self.format_box.setLayout(format_layout)
+
+        format_layout.addWidget(QLabel("Data Type"), 0, 0, Qt.AlignRight)
+        self.dtype_box = QComboBox()
+        self.dtype_box.addItems(RawBinaryDialog.DTYPES)
+        self.dtype_box.setCurrentText("uint16")
+        format_layout.addWidget(self.dtype_box, 0, 1, 1, 2)
+
+        format_layout.addWidget(QLabel("Byte Order"), 1, 0, Qt.AlignRight)
+        self.byte_order_box = QComboBox()
+        self.byte_order_box.addItems(list(RawBinaryDialog.BYTE_ORDERS.keys()))
+        format_layout.addWidget(self.byte_order_box, 1, 1, 1, 2)
+
+        format_layout.addWidget(QLabel("Detector"), 2, 0, Qt.AlignRight)
+        self.frame_boxes = []
+        for column in (1, 2):
+            box = QSpinBox()
+            box.setRange(1, 2**16)
+            box.setValue(256)
+            format_layout.addWidget(box, 2, column)
+            self.frame_boxes.append(box)
+
+        self.offset_label = QLabel("File Header")
+        format_layout.addWidget(self.offset_label, 3, 0, Qt.AlignRight)
+        self.offset_box = QSpinBox()
+        self.offset_box.setRange(0, 2**31 - 1)
+        format_layout.addWidget(self.offset_box, 3, 1, 1, 2)
+
+        self.frame_header_label = QLabel("Frame Header")
+        format_layout.addWidget(self.frame_header_label, 4, 0, Qt.AlignRight)
+        self.frame_header_box = QSpinBox()
+        self.frame_header_box.setRange(0, 2**31 - 1)
+        format_layout.addWidget(self.frame_header_box, 4, 1, 1, 2)
+
+        self.frame_padding_label = QLabel("Frame Padding")
+        format_layout.addWidget(self.frame_padding_label, 5, 0, Qt.AlignRight)
+        self.frame_padding_box = QSpinBox()
+        self.frame_padding_box.setRange(0, 2**31 - 1)
+        format_layout.addWidget(self.frame_padding_box, 5, 1, 1, 2)
+
+        scan_box = QGroupBox("Scan")
+        layout.addWidget(scan_box)
+        scan_layout = QHBoxLayout()
+        scan_box.setLayout(scan_layout)
+        self.scan_boxes = []
+        for label in ("X:", "Y:"):
+            scan_layout.addWidget(QLabel(label))
+            box = QSpinBox()
+            box.setRange(1, 2**16)
+            box.setValue(256)
+            scan_layout.addWidget(box)
+            self.scan_boxes.append(box)
+
+        button_layout = QHBoxLayout()
+        button_layout.addStretch()
+        cancel_button = QPushButton("Cancel")
+        cancel_button.pressed.connect(self.close)
+        button_layout.addWidget(cancel_button)
+        done_button = QPushButton("Start")
+        done_button.pressed.connect(self.set_and_close)
+        button_layout.addWidget(done_button)
+        layout.addLayout(button_layout)
+
+        self.source_changed(self.source_box.currentText())
+
+    @classmethod
+    def get_options(cls, parent=None):
+        dialog = cls(parent=parent)
+        dialog.exec_()
+        return dialog.options
+
+    def source_changed(self, source):
+        is_file = source != "Socket"
+        self.path_label.setText("File" if is_file else "Address")
+        self.path_box.setPlaceholderText("" if is_file else "localhost:5000")
+        self.browse_button.setEnabled(is_file)
+        self.format_box.setEnabled(source != "HDF5 File")
+        for widget in (
+            self.offset_label,
+            self.offset_box,
+            self.frame_header_label,
+            self.frame_header_box,
+            self.frame_padding_label,
+            self.frame_padding_box,
+        ):
+            widget.setEnabled(source == "Raw File")
+
+    def browse(self):
+        filename, _ = QFileDialog.getOpenFileName(self, "Acquisition File")
+        if filename:
+            self.path_box.setText(filename)
+
+    def set_and_close(self):
+        byte_order = RawBinaryDialog.BYTE_ORDERS[self.byte_order_box.currentText()]
+        self.options = {
+            "source": self.source_box.currentText(),
+            "path": self.path_box.text() or self.path_box.placeholderText(),
+            "dtype": np.dtype(self.dtype_box.currentText()).newbyteorder(byte_order),
+            "frame_shape": tuple(box.value() for box in self.frame_boxes),
+            "offset": self.offset_box.value(),
+            "frame_header": self.frame_header_box.value(),
+            "frame_padding": self.frame_padding_box.value(),
+            "scan_shape": tuple(box.value() for box in self.scan_boxes),
+        }
+        self.close()
+
+
+class AutoTCBFDialog(QDialog):
+    def __init__(self, parent, energy=300.0):
+        super().__init__(parent=parent)
+
+        self.parameters = None
+
+        layout = QVBoxLayout(self)
+
+        params_box = QGroupBox("Parameters")
+        layout.addWidget(params_box)
+
+        params_layout = QGridLayout()
+        params_box.setLayout(params_layout)
+
+        params_layout.addWidget(QLabel("Beam Energy [keV]"), 0, 0, Qt.AlignRight)
+        self.energy_box = QLineEdit(f"{energy:g}")
+        self.energy_box.setValidator(QDoubleValidator())
+        params_layout.addWidget(self.energy_box, 0, 1)
+
+        params_layout.addWidget(QLabel("Iterations at Min Bin"), 1, 0, Qt.AlignRight)
+        self.iterations_box = QSpinBox()
+        self.iterations_box.setRange(1, 100)
+        self.iterations_box.setValue(2)
+        params_layout.addWidget(self.iterations_box, 1, 1)
+
+        params_layout.addWidget(QLabel("Regularize Shifts"), 2, 0, Qt.AlignRight)
+        self.regularize_box = QCheckBox()
+        params_layout.addWidget(self.regularize_box, 2, 1)
+
+        button_layout = QHBoxLayout()
+        button_layout.addStretch()
+        cancel_button = QPushButton("Cancel")
+        cancel_button.pressed.connect(self.close)
+        button_layout.addWidget(cancel_button)
+        done_button = QPushButton("Reconstruct")
+        done_button.pressed.connect(self.set_and_close)
+        button_layout.addWidget(done_button)
+        layout.addLayout(button_layout)
+
+    @classmethod
+    def get_parameters(cls, parent=None, energy=300.0):
+        dialog = cls(parent=parent, energy=energy)
+        dialog.exec_()
+        return dialog.parameters
+
+    def set_and_close(self):
+        if self.energy_box.text() == "":
+            return
+
+        self.parameters = {
+            "energy": float(self.energy_box.text()),
+            "num_iter_at_min_bin": self.iterations_box.value(),
+            "regularize_shifts": self.regularize_box.isChecked(),
+        }
+        self.close()
+
+
 class ManualTCBFDialog(QDialog):
+    # Memory used for each batch of image spectra during reconstruction
+    FFT_BATCH_BYTES = 256 * 2**20
+    # Largest stack of per-pixel image spectra kept between reconstructions,
+    # when the viewer's memory budget can't be determined
+    SPECTRA_CACHE_BYTES = 4 * 2**30
+
     def __init__(self, parent):
         super().__init__(parent=parent)
 
         self.parent = parent
 
+        # Per-detector-pixel images or their spectra, kept so that changing
+        # only the shift parameters does not re-read the BF disk
+        self.cache = None
+        self.busy = False
+
         layout = QVBoxLayout(self)
 
         ####### LAYOUT ########
@@ -305,6 +956,9 @@ class ManualTCBFDialog(QDialog):
         self.rotation_box = QLineEdit()
         self.rotation_box.setValidator(QDoubleValidator())
         params_layout.addWidget(self.rotation_box, 0, 1)
+        self.rotation_slider = QSlider(Qt.Horizontal)
+        self.rotation_slider.setRange(-1800, 1800)
+        params_layout.addWidget(self.rotation_slider, 0, 2)
 
         params_layout.addWidget(QLabel("Transpose x/y"), 1, 0, Qt.AlignRight)
         self.transpose_box = QCheckBox()
@@ -314,11 +968,18 @@ class ManualTCBFDialog(QDialog):
         self.max_shift_box = QLineEdit()
         self.max_shift_box.setValidator(QDoubleValidator())
         params_layout.addWidget(self.max_shift_box, 2, 1)
+        self.max_shift_slider = QSlider(Qt.Horizontal)
+        self.max_shift_slider.setRange(0, 500)
+        params_layout.addWidget(self.max_shift_slider, 2, 2)
 
         params_layout.addWidget(QLabel("Pad Images"), 3, 0, Qt.AlignRight)
         self.pad_checkbox = QCheckBox()
         params_layout.addWidget(self.pad_checkbox, 3, 1)
 
+        params_layout.addWidget(QLabel("Live Update"), 4, 0, Qt.AlignRight)
+        self.live_checkbox = QCheckBox()
+        params_layout.addWidget(self.live_checkbox, 4, 1)
+
         button_layout = QHBoxLayout()
         button_layout.addStretch()
         cancel_button = QPushButton("Cancel")
@@ -329,9 +990,48 @@ class ManualTCBFDialog(QDialog):
         button_layout.addWidget(done_button)
         layout.addLayout(button_layout)
 
-    def reconstruct(self):
-        datacube = self.parent.datacube
+        ######### CALLBACKS ########
+        # Parameter changes are collected for a moment before reconstructing,
+        # so dragging a slider does not queue up a reconstruction per step
+        self.live_timer = QTimer(self)
+        self.live_timer.setSingleShot(True)
+        self.live_timer.setInterval(50)
+        self.live_timer.timeout.connect(self.reconstruct)
+
+        self.rotation_slider.valueChanged.connect(
+            partial(self.slider_changed, self.rotation_box)
+        )
+        self.max_shift_slider.valueChanged.connect(
+            partial(self.slider_changed, self.max_shift_box)
+        )
+        self.rotation_box.textEdited.connect(
+            partial(self.box_changed, self.rotation_slider)
+        )
+        self.max_shift_box.textEdited.connect(
+            partial(self.box_changed, self.max_shift_slider)
+        )
+        self.transpose_box.stateChanged.connect(self.parameters_changed)
+        self.pad_checkbox.stateChanged.connect(self.parameters_changed)
+
+    def slider_changed(self, box, new_value):
+        box.setText(f"{new_value / 10:g}")
+        self.parameters_changed()
+
+    def box_changed(self, slider, new_text):
+        try:
+            value = float(new_text)
+        except ValueError:
+            return
+        slider.blockSignals(True)
+        slider.setValue(int(round(value * 10)))
+        slider.blockSignals(False)
+        self.parameters_changed()
 
+    def parameters_changed(self, *args):
+        if self.live_checkbox.isChecked():
+            self.live_timer.start()
+
+    def get_mask(self):
         # tcBF requires an area detector for generating the mask
         detector_shape = (
             self.parent.detector_shape_group.checkedAction().text().replace("&", "")
@@ -343,7 +1043,7 @@ class ManualTCBFDialog(QDialog):
             self.parent.statusBar().showMessage(
                 "tcBF requires a selection of the BF disk"
             )
-            return
+            return None
 
         if detector_shape == "Rectangular":
             # Get slices corresponding to ROI
@@ -372,6 +1072,28 @@ class ManualTCBFDialog(QDialog):
         else:
             raise ValueError("idk how we got here...")
 
+        return mask
+
+    def reconstruct(self):
+        # Progress messages process pending events, which can fire the live
+        # update timer while a reconstruction is still running
+        if self.busy:
+            self.live_timer.start()
+            return
+
+        self.busy = True
+        try:
+            self.run_reconstruction()
+        finally:
+            self.busy = False
+
+    def run_reconstruction(self):
+        datacube = self.parent.datacube
+
+        mask = self.get_mask()
+        if mask is None:
+            return
+
         if self.max_shift_box.text() == "":
             self.parent.statusBar().showMessage("Max Shift must be specified")
             return
@@ -409,57 +1131,170 @@ class ManualTCBFDialog(QDialog):
         shifts_pix = np.stack([shifts_pix_x, shifts_pix_y], axis=2) @ R
         shifts_pix_x, shifts_pix_y = shifts_pix[..., 0], shifts_pix[..., 1]
 
-        # generate image to accumulate reconstruction
+        # generate image to accumulate reconstruction. Shifts of the BF disk
+        # pixels never exceed max_shift, so that bounds the padding
         pad = self.pad_checkbox.checkState()
-        pad_width = int(
-            np.maximum(np.abs(shifts_pix_x).max(), np.abs(shifts_pix_y).max())
-        )
+        pad_width = int(np.ceil(max_shift)) if pad else 0
 
-        reconstruction = (
-            np.zeros((datacube.R_Nx + 2 * pad_width, datacube.R_Ny + 2 * pad_width))
-            if pad
-            else np.zeros((datacube.R_Nx, datacube.R_Ny))
+        cache = self.get_image_cache(datacube, mask, pad_width)
+        pad_width = cache["pad_width"]
+        recon_shape = (
+            datacube.R_Nx + 2 * pad_width,
+            datacube.R_Ny + 2 * pad_width,
         )
 
-        qx = np.fft.fftfreq(reconstruction.shape[0])
-        qy = np.fft.fftfreq(reconstruction.shape[1])
-
-        qx_operator, qy_operator = np.meshgrid(qx, qy, indexing="ij")
-        qx_operator = qx_operator * -2.0j * np.pi
-        qy_operator = qy_operator * -2.0j * np.pi
-
-        # loop over images and shift
-        img_indices = np.argwhere(mask)
-        for mx, my in tqdm(
-            img_indices,
-            desc="Shifting images",
-            file=StatusBarWriter(self.parent.statusBar()),
-            mininterval=1.0,
-        ):
-            if mask[mx, my]:
-                img_raw = datacube.data[:, :, mx, my]
-
-                if pad:
-                    img = np.zeros_like(reconstruction) + img_raw.mean()
-                    img[
-                        pad_width : img_raw.shape[0] + pad_width,
-                        pad_width : img_raw.shape[1] + pad_width,
-                    ] = img_raw
-                else:
-                    img = img_raw
-
-                reconstruction += np.real(
-                    np.fft.ifft2(
-                        np.fft.fft2(img)
-                        * np.exp(
-                            qx_operator * shifts_pix_x[mx, my]
-                            + qy_operator * shifts_pix_y[mx, my]
-                        )
-                    )
+        # The shifted images are summed in Fourier space, so only one inverse
+        # FFT is needed at the end. The shift phase ramp is separable into a
+        # product of 1D factors along qx and qy.
+        qx = np.fft.fftfreq(recon_shape[0])
+        qy = np.fft.rfftfreq(recon_shape[1])
+        spectrum = np.zeros((qx.size, qy.size), dtype=np.complex128)
+
+        img_indices = cache["indices"]
+        shifts_x = shifts_pix_x[img_indices[:, 0], img_indices[:, 1]]
+        shifts_y = shifts_pix_y[img_indices[:, 0], img_indices[:, 1]]
+        batch_size = self.get_batch_size(recon_shape)
+        # On even-by-even grids the (Nyquist, Nyquist) term is its own mirror
+        # image, and keeping shifted images real needs cos(π (sx + sy)) there,
+        # which the product of the 1D factors doesn't give
+        corner = (
+            (recon_shape[0] // 2, recon_shape[1] // 2)
+            if recon_shape[0] % 2 == 0 and recon_shape[1] % 2 == 0
+            else None
+        )
+        for start in range(0, len(img_indices), batch_size):
+            batch = slice(start, start + batch_size)
+            img_fft = self.get_batch_spectra(datacube, cache, batch)
+            if corner is not None:
+                corner_terms = img_fft[:, corner[0], corner[1]].copy()
+            img_fft *= shift_phase_ramp(qx, shifts_x[batch], recon_shape[0])[:, :, None]
+            img_fft *= shift_phase_ramp(qy, shifts_y[batch], recon_shape[1])[:, None, :]
+            if corner is not None:
+                img_fft[:, corner[0], corner[1]] = corner_terms * np.cos(
+                    np.pi * (shifts_x[batch] + shifts_y[batch])
                 )
+            spectrum += img_fft.sum(axis=0)
+
+        reconstruction = scipy.fft.irfft2(spectrum, s=recon_shape, workers=-1)
 
         # crop away padding so the image lines up with the original
-        if pad:
+        if pad_width:
             reconstruction = reconstruction[pad_width:-pad_width, pad_width:-pad_width]
 
         self.parent.set_virtual_image(reconstruction, reset=True)
+
+    def get_batch_size(self, recon_shape):
+        spectrum_bytes = 8 * recon_shape[0] * (recon_shape[1] // 2 + 1)
+        return max(
+            1, self.FFT_BATCH_BYTES // (spectrum_bytes + 4 * np.prod(recon_shape))
+        )
+
+    def get_image_cache(self, datacube, mask, pad_width):
+        """
+        Return the cached per-pixel images for mask, reading and transforming
+        them if the mask, dataset, or padding changed since the last run. A
+        cache padded more widely than requested is reused as is.
+        """
+        if (
+            self.cache is not None
+            and self.cache["data"]() is datacube.data
+            and np.array_equal(self.cache["mask"], mask)
+            and (
+                self.cache["pad_width"] >= pad_width > 0
+                or self.cache["pad_width"] == pad_width
+            )
+        ):
+            return self.cache
+
+        self.cache = None
+        img_indices = np.argwhere(mask)
+        recon_shape = (
+            datacube.R_Nx + 2 * pad_width,
+            datacube.R_Ny + 2 * pad_width,
+        )
+        spectrum_bytes = 8 * recon_shape[0] * (recon_shape[1] // 2 + 1)
+        image_bytes = 2 * datacube.R_Nx * datacube.R_Ny
+        budget = self.parent.get_memory_budget()
+        if budget is None:
+            budget = self.SPECTRA_CACHE_BYTES
+
+        # Store the spectra if they fit in the memory budget, otherwise a
+        # float16 stack of the raw images so that at least the reads are not
+        # repeated
+        if len(img_indices) * spectrum_bytes <= budget:
+            store = "spectra"
+            stack = np.empty(
+                (len(img_indices), recon_shape[0], recon_shape[1] // 2 + 1),
+                dtype=np.complex64,
+            )
+        elif len(img_indices) * image_bytes <= budget:
+            store = "images"
+            stack = np.empty(
+                (len(img_indices), datacube.R_Nx, datacube.R_Ny), dtype=np.float16
+            )
+        else:
+            store = None
+            stack = None
+
+        # a weak reference, so that the cache doesn't keep replaced data alive
+        cache = {
+            "data": weakref.ref(datacube.data),
+            "mask": mask,
+            "pad_width": pad_width,
+            "indices": img_indices,
+            "store": store,
+            "stack": None,
+        }
+
+        if stack is not None:
+            batch_size = self.get_batch_size(recon_shape)
+            for start in tqdm(
+                range(0, len(img_indices), batch_size),
+                desc="Transforming images",
+                file=StatusBarWriter(self.parent.statusBar()),
+                mininterval=1.0,
+            ):
+                batch = slice(start, start + batch_size)
+                if store == "spectra":
+                    stack[batch] = self.get_batch_spectra(datacube, cache, batch)
+                else:
+                    imgs = gather_images(datacube.data, img_indices[batch])
+                    if np.abs(imgs).max() >= np.finfo(np.float16).max:
+                        # values out of float16 range, read each time instead
+                        cache["store"] = None
+                        stack = None
+                        break
+                    stack[batch] = imgs
+            cache["stack"] = stack
+
+        self.cache = cache
+        return cache
+
+    def get_batch_spectra(self, datacube, cache, batch):
+        if cache["store"] == "spectra" and cache["stack"] is not None:
+            return cache["stack"][batch].copy()
+
+        if cache["store"] == "images" and cache["stack"] is not None:
+            imgs = cache["stack"][batch].astype(np.float32)
+        else:
+            imgs = gather_images(datacube.data, cache["indices"][batch])
+
+        pad_width = cache["pad_width"]
+        if pad_width:
+            padded = np.empty(
+                (
+                    imgs.shape[0],
+                    imgs.shape[1] + 2 * pad_width,
+                    imgs.shape[2] + 2 * pad_width,
+                ),
+                dtype=np.float32,
+            )
+            padded[:] = imgs.mean(axis=(1, 2))[:, None, None]
+            padded[
+                :,
+                pad_width : imgs.shape[1] + pad_width,
+                pad_width : imgs.shape[2] + pad_width,
+            ] = imgs
+            imgs = padded
+
+        return scipy.fft.rfft2(imgs, workers=-1)
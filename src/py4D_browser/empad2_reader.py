@@ -1,7 +1,21 @@
 import empad2
 from PyQt5.QtWidgets import QFileDialog, QMessageBox, QApplication
 import numpy as np
-from py4D_browser.utils import StatusBarWriter
+import os
+import re
+import py4DSTEM
+from concurrent.futures import ThreadPoolExecutor
+from py4D_browser.menu_actions import write_hdf5_array, preallocate, HDF5_CODECS
+from py4D_browser.dialogs import CompressionDialog
+from py4D_browser.utils import memmap_frames
+
+# Raw EMPAD-G2 frames are 128x128 32 bit words, followed by two rows of
+# metadata
+FRAME_SHAPE = (128, 128)
+FRAME_PADDING = 2 * 128 * 4
+
+# Most frames calibrated in one go, bounding the temporaries to a few MB
+CALIBRATION_FRAMES = 64
 
 
 def set_empad2_sensor(self, sensor_name):
@@ -22,50 +36,219 @@ def load_empad2_background(self):
         )
 
 
+def get_empad2_background(self):
+    # The loaded background, or zeros if the user wants to go ahead without
+    # one. None means the user backed out.
+    if self.empad2_background is not None:
+        return self.empad2_background
+
+    continue_wo_bkg = QMessageBox.question(
+        self,
+        "Load without background?",
+        "Background data has not been loaded. Do you want to continue loading data?",
+    )
+    if continue_wo_bkg == QMessageBox.No:
+        return None
+
+    return {
+        "even": np.zeros((128, 128), dtype=np.float32),
+        "odd": np.zeros((128, 128), dtype=np.float32),
+    }
+
+
 def load_empad2_dataset(self):
+    """
+    Calibrate an EMPAD-G2 dataset into a preallocated float32 datacube, one
+    block of scan rows at a time on a background task, showing the part
+    calibrated so far as it fills.
+    """
     if self.empad2_calibrations is not None:
-        dummy_data = False
-        if self.empad2_background is None:
-            continue_wo_bkg = QMessageBox.question(
-                self,
-                "Load without background?",
-                "Background data has not been loaded. Do you want to continue loading data?",
-            )
-            if continue_wo_bkg == QMessageBox.No:
-                return
-            else:
-                self.empad2_background = {
-                    "even": np.zeros((128, 128), dtype=np.float32),
-                    "odd": np.zeros((128, 128), dtype=np.float32),
-                }
-                dummy_data = True
+        background = get_empad2_background(self)
+        if background is None:
+            return
 
         filename = raw_file_dialog(self)
-        self.datacube = empad2.load_dataset(
-            filename,
-            self.empad2_background,
-            self.empad2_calibrations,
-            _tqdm_args={
-                "desc": "Loading",
-                "file": StatusBarWriter(self.statusBar()),
-                "mininterval": 1.0,
-            },
-        )
-
-        if dummy_data:
-            self.empad2_background = None
+        source = CalibratedEMPAD2(filename, background, self.empad2_calibrations)
+        self.cancel_load()
+        self.datacube = py4DSTEM.DataCube(preallocate(source))
 
         self.update_diffraction_space_view(reset=True)
         self.update_real_space_view(reset=True)
 
         self.setWindowTitle(filename)
 
+        self.fill_progressively(source, filename)
+
     else:
         QMessageBox.warning(
             self, "No calibrations loaded!", "Please select a sensor first"
         )
 
 
+def convert_empad2_dataset(self):
+    if self.empad2_calibrations is None:
+        QMessageBox.warning(
+            self, "No calibrations loaded!", "Please select a sensor first"
+        )
+        return
+
+    background = get_empad2_background(self)
+    if background is None:
+        return
+
+    filename = raw_file_dialog(self)
+    savename = self.get_savefile_name("Plain HDF5")
+
+    # the chunk shapes offered depend on the scan shape
+    source = CalibratedEMPAD2(filename, background, self.empad2_calibrations)
+    compression = CompressionDialog.get_options(HDF5_CODECS, source.shape, parent=self)
+    if compression is None:
+        return
+
+    self.run_in_background(
+        calibrate_empad2_to_hdf5,
+        source,
+        savename,
+        compression,
+        on_success=lambda _: self.load_file(savename, mmap=True),
+        description="Converting EMPAD-G2 data",
+    )
+
+
+def find_empad2_scan_shape(filepath, n_frames):
+    # EMPAD files are named with their scan size, as in scan_x256_y256.raw;
+    # failing that, assume a square scan
+    match = re.search(r"_x(\d+)_y(\d+)", os.path.basename(filepath))
+    if match is not None:
+        shape = (int(match.group(2)), int(match.group(1)))
+        if shape[0] * shape[1] <= n_frames:
+            return shape
+    N = int(np.round(np.sqrt(n_frames)))
+    return (N, N) if N * N == n_frames else (1, n_frames)
+
+
+class CalibratedEMPAD2:
+    """
+    Lazy (Rx, Ry, 128, 128) float32 view of a raw EMPAD-G2 file: indexing it
+    reads the raw frames of the requested scan rows and calibrates them with
+    calibrate_frames, split into runs of frames of similar length across the
+    instance's pool of threads. Reading it in blocks of scan rows streams the
+    calibration with bounded memory.
+    """
+
+    def __init__(self, filepath, background, calibrations):
+        self.frames = memmap_frames(
+            filepath, np.uint32, FRAME_SHAPE, frame_padding=FRAME_PADDING
+        )
+        self.scan_shape = find_empad2_scan_shape(filepath, self.frames.shape[0])
+        self.shape = (*self.scan_shape, *FRAME_SHAPE)
+        self.dtype = np.dtype(np.float32)
+        self.background = background
+        self.calibrations = calibrations
+        self.workers = os.cpu_count() or 1
+        self.pool = ThreadPoolExecutor(self.workers)
+
+    @property
+    def ndim(self):
+        return 4
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self[...], dtype=dtype)
+
+    def __getitem__(self, key):
+        key = key if isinstance(key, tuple) else (key,)
+        if any(k is Ellipsis for k in key):
+            i = key.index(Ellipsis)
+            key = key[:i] + (slice(None),) * (5 - len(key)) + key[i + 1 :]
+        rows = key[0] if key else slice(None)
+        if isinstance(rows, (int, np.integer)):
+            return self[rows : rows + 1 if rows != -1 else None][(0, *key[1:])]
+
+        # calibrate whole scan rows, then apply the rest of the key
+        start, stop, step = rows.indices(self.shape[0])
+        row_indices = range(start, stop, step)
+        Ny = self.shape[1]
+        out = np.empty((len(row_indices), *self.shape[1:]), dtype=self.dtype)
+        out_frames = out.reshape(-1, *FRAME_SHAPE)
+        jobs = [
+            self.pool.submit(
+                calibrate_frames,
+                self.frames[first : first + n],
+                first,
+                self.background,
+                self.calibrations,
+                out_frames[i : i + n],
+            )
+            for first, i, n in split_frame_runs(row_indices, Ny, self.workers)
+        ]
+        for job in jobs:
+            job.result()
+        return out[(slice(None), *key[1:])]
+
+
+def split_frame_runs(row_indices, Ny, n_jobs):
+    """
+    Split the frames of the given scan rows into runs of consecutive frames,
+    as (first frame in the file, first frame in the output, number of
+    frames). Adjacent rows are merged and then cut into runs of at most
+    1/n_jobs of the frames, and at most CALIBRATION_FRAMES, so a contiguous
+    block gives at least n_jobs runs of similar length.
+    """
+    segments = []
+    for i, row in enumerate(row_indices):
+        if segments and segments[-1][0] + segments[-1][2] == row * Ny:
+            segments[-1][2] += Ny
+        else:
+            segments.append([row * Ny, i * Ny, Ny])
+
+    total = len(row_indices) * Ny
+    length = max(1, min(-(-total // n_jobs), CALIBRATION_FRAMES))
+    runs = []
+    for first, i, n in segments:
+        for offset in range(0, n, length):
+            runs.append((first + offset, i + offset, min(length, n - offset)))
+    return runs
+
+
+def calibrate_frames(raw, first_frame, background, calibrations, out):
+    """
+    Calibrate raw EMPAD-G2 frames into out, as empad2 does. Each 32 bit pixel
+    holds a 14 bit analog value, a 17 bit digital count of charge resets and
+    a gain bit. The two alternating capacitor banks have their own gains,
+    offsets, flat fields and background: the A calibrations and the "even"
+    background apply to even frame numbers (counted from first_frame) and
+    the B ones to odd frame numbers.
+    """
+    raw = np.asarray(raw)
+    analog = np.bitwise_and(raw, 0x3FFF).astype(np.float32)
+    digital = np.right_shift(np.bitwise_and(raw, 0x3FFFC000), 14).astype(np.float32)
+    gain_bit = np.right_shift(raw, 31).astype(np.float32)
+
+    for parity, bank, bkg in ((0, "A", "even"), (1, "B", "odd")):
+        frames = slice((parity - first_frame) % 2, None, 2)
+        a, d, g = analog[frames], digital[frames], gain_bit[frames]
+        out[frames] = (
+            a * (1 - g)
+            + calibrations[f"G1{bank}"] * (a - calibrations[f"B2{bank}"]) * g
+            + calibrations[f"G2{bank}"] * d
+            - background[bkg]
+        ) * calibrations[f"FF{bank}"]
+    return out
+
+
+def calibrate_empad2_to_hdf5(task, source, savename, compression):
+    # Calibrated blocks of scan rows are written as they are computed, so
+    # the whole cube is never held in memory
+    write_hdf5_array(task, source, savename, compression=compression)
+
+
 def raw_file_dialog(browser):
     filename = QFileDialog.getOpenFileName(
         browser,
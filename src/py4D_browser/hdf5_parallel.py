@@ -0,0 +1,140 @@
+"""
+Multi-process reading of compressed HDF5 datacubes. h5py serializes all
+decompression behind one global lock, so compressed datasets are read on a
+pool of worker processes, each with its own file handle, writing straight
+into an output array in shared memory. This module is imported by the
+workers and so avoids pulling in Qt.
+"""
+
+import numpy as np
+import h5py
+import os
+import glob
+import tempfile
+import importlib
+import multiprocessing
+import weakref
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+if importlib.util.find_spec("hdf5plugin") is not None:
+    # register the plugin filters in the worker processes too
+    import hdf5plugin
+
+# tmpfs on Linux, so the output file lives in shared memory
+SHARED_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+_open_files = {}
+
+
+def is_compressed(dset) -> bool:
+    return isinstance(dset, h5py.Dataset) and (
+        dset.id.get_create_plist().get_nfilters() > 0
+    )
+
+
+def create_shared_array(shape, dtype):
+    """
+    A zeroed array backed by a file in shared memory that worker processes
+    can map by its path, found with shared_array_path. Falls back to the temp
+    dir if shared memory is too small to hold it (writing past the end of a
+    full tmpfs crashes with SIGBUS instead of raising), and returns None if
+    neither has room. The file is removed when the array is garbage
+    collected or the process exits, and files left by processes that died
+    are removed the next time an array is created.
+    """
+    remove_stale_shared_files()
+    nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    for directory in dict.fromkeys([SHARED_DIR, tempfile.gettempdir()]):
+        stat = os.statvfs(directory)
+        if stat.f_bavail * stat.f_frsize > nbytes:
+            break
+    else:
+        return None
+
+    fd, path = tempfile.mkstemp(
+        prefix=f"py4DGUI_{os.getpid()}_", suffix=".bin", dir=directory
+    )
+    os.close(fd)
+    try:
+        mapped = np.memmap(path, dtype=dtype, mode="w+", shape=shape)
+    except BaseException:
+        remove_shared_file(path)
+        raise
+    weakref.finalize(mapped, remove_shared_file, path)
+    return np.asarray(mapped)
+
+
+def remove_shared_file(path):
+    # mappings of the file stay valid after its name is removed
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def remove_stale_shared_files():
+    for directory in dict.fromkeys([SHARED_DIR, tempfile.gettempdir()]):
+        for path in glob.glob(os.path.join(directory, "py4DGUI_*_*.bin")):
+            pid = os.path.basename(path).split("_")[1]
+            if pid.isdigit() and not pid_exists(int(pid)):
+                remove_shared_file(path)
+
+
+def pid_exists(pid) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def shared_array_path(array):
+    base = array.base if not isinstance(array, np.memmap) else array
+    return base.filename if isinstance(base, np.memmap) else None
+
+
+def read_rows(filepath, name, out_path, start, stop):
+    # Runs in a worker: decompress scan rows start:stop into the shared array
+    if filepath not in _open_files:
+        _open_files[filepath] = h5py.File(filepath, "r")
+    dset = _open_files[filepath][name]
+    out = np.memmap(out_path, dtype=dset.dtype, mode="r+", shape=dset.shape)
+    dset.read_direct(out, np.s_[start:stop], np.s_[start:stop])
+    out.flush()
+    return start, stop
+
+
+def read_parallel(task, dset, out, max_workers=None, block_bytes=32 * 2**20):
+    """
+    Fill the shared array out with dset, split into blocks of whole chunk
+    rows that are decompressed on worker processes. task is the calling
+    BackgroundTask, used for progress, partial results and cancellation.
+    """
+    out_path = shared_array_path(out)
+    row_bytes = int(np.prod(dset.shape[1:])) * dset.dtype.itemsize
+    chunk_rows = dset.chunks[0] if dset.chunks is not None else 1
+    rows_per_block = max(1, block_bytes // (row_bytes * chunk_rows)) * chunk_rows
+    blocks = [
+        (start, min(start + rows_per_block, dset.shape[0]))
+        for start in range(0, dset.shape[0], rows_per_block)
+    ]
+
+    # spawned workers don't inherit the GUI's threads and locks
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers, mp_context=context) as pool:
+        futures = [
+            pool.submit(read_rows, dset.file.filename, dset.name, out_path, *block)
+            for block in blocks
+        ]
+        try:
+            for n, future in enumerate(as_completed(futures), start=1):
+                start, stop = future.result()
+                task.check_cancelled()
+                task.report(f"Decompressed {n}/{len(blocks)} blocks")
+                task.publish(stop)
+        finally:
+            for future in futures:
+                future.cancel()
+            remove_shared_file(out_path)
@@ -0,0 +1,302 @@
+import pyqtgraph as pg
+import numpy as np
+from PyQt5.QtCore import QRectF
+from PyQt5.QtGui import QTransform
+from PyQt5.QtWidgets import QWidget, QHBoxLayout
+
+# Images are subsampled to about this many pixels for statistics
+STATISTICS_PIXELS = 256 * 256
+
+# Images with no side longer than this are always shown whole
+LOD_MIN_SIZE = 2048
+
+# Side of the tiles (in pixels of the chosen level) that uploads snap to
+LOD_TILE_SIZE = 256
+
+
+class ImageExtent(pg.GraphicsObject):
+    """
+    An invisible stand-in for an ImageItem holding the whole of an image,
+    placed and sized as that item would be, for ROIs to map onto the data
+    while only part of the image is displayed.
+    """
+
+    axisOrder = "col-major"
+
+    def __init__(self):
+        super().__init__()
+        self.shape = (1, 1)
+
+    def setShape(self, shape):
+        self.prepareGeometryChange()
+        self.shape = tuple(shape[:2])
+        self.resetTransform()
+
+    def width(self):
+        return self.shape[0]
+
+    def height(self):
+        return self.shape[1]
+
+    def boundingRect(self):
+        return QRectF(0, 0, *self.shape)
+
+    def setRect(self, *args):
+        rect = args[0] if isinstance(args[0], QRectF) else QRectF(*args)
+        transform = QTransform()
+        transform.translate(rect.left(), rect.top())
+        transform.scale(rect.width() / self.width(), rect.height() / self.height())
+        self.setTransform(transform)
+
+    def paint(self, painter, *args):
+        pass
+
+
+class LightImageView(QWidget):
+    """
+    A lighter stand-in for pg.ImageView, showing a single image in a
+    ViewBox with an optional levels panel. Unlike ImageView, setting an
+    image renders it once, with the given levels, and skips the upload if
+    neither the image nor the levels changed. The histogram and the min/max
+    used by autoLevels come from a subsample of the image, and the histogram
+    is only computed while the levels panel is shown.
+
+    Large images are shown through a mip-map: only the tiles in view are
+    uploaded, from the coarsest level that still has a pixel per screen
+    pixel, so zooming in loads finer tiles and the cost of a repaint does
+    not grow with the image. The displayed item then holds only part of the
+    image, so getImageItem returns an ImageExtent spanning the whole image,
+    for mapping ROIs onto the data.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(0)
+
+        self.graphics_view = pg.GraphicsView()
+        self.view = pg.ViewBox()
+        self.view.setAspectLocked(True)
+        self.view.invertY()
+        self.graphics_view.setCentralItem(self.view)
+        layout.addWidget(self.graphics_view)
+
+        self.imageItem = pg.ImageItem()
+        self.view.addItem(self.imageItem)
+
+        self.reference_item = ImageExtent()
+        self.view.addItem(self.reference_item)
+
+        # The levels panel is not linked to the image item, so that it does
+        # not recompute the histogram on every update
+        self.histogram = pg.HistogramLUTWidget()
+        self.histogram.item.sigLevelsChanged.connect(self.histogram_levels_changed)
+        self.histogram.item.sigLookupTableChanged.connect(
+            self.histogram_lookup_table_changed
+        )
+        self.histogram.hide()
+        layout.addWidget(self.histogram)
+
+        self.image = None
+        self.levels = None
+        self.statistics = None
+        self.histogram_stale = True
+        self.updating_histogram = False
+
+        # Downsampled copies of the image, level k binned by 2**k
+        self.mipmap = []
+        self.displayed = None
+
+        self.view.sigRangeChanged.connect(self.update_tiles)
+        self.view.sigResized.connect(self.update_tiles)
+
+    def getView(self):
+        return self.view
+
+    def getImageItem(self):
+        return self.reference_item
+
+    def addItem(self, item):
+        self.view.addItem(item)
+
+    def removeItem(self, item):
+        self.view.removeItem(item)
+
+    def setImage(self, img, autoRange=True, autoLevels=True, levels=None):
+        """
+        Show img, in the column-major order that pg.ImageView expects. With
+        levels None, the levels are fit to the image if autoLevels is set and
+        kept as they are otherwise.
+        """
+        unchanged = (
+            self.image is not None
+            and img is not self.image
+            and img.shape == self.image.shape
+            and img.dtype == self.image.dtype
+            and np.array_equal(img, self.image, equal_nan=img.dtype.kind in "fc")
+        )
+        if not unchanged:
+            self.image = img
+            self.statistics = None
+            self.histogram_stale = True
+            self.mipmap = [img]
+            self.displayed = None
+            if img.shape[:2] != self.reference_item.shape:
+                self.reference_item.setShape(img.shape)
+
+        if levels is None and (autoLevels or self.levels is None):
+            levels = self.get_statistics()[:2]
+        if levels is not None and tuple(levels) != self.levels:
+            self.levels = tuple(levels)
+            if unchanged:
+                self.imageItem.setLevels(self.levels)
+
+        if autoRange:
+            self.autoRange()
+        self.update_tiles()
+
+        if not self.histogram.isHidden():
+            self.update_histogram()
+
+    def get_level(self, k):
+        # Level k of the mip-map, made from level k - 1 by 2x2 means
+        while len(self.mipmap) <= k:
+            finer = self.mipmap[-1]
+            nx, ny = finer.shape[0] // 2, finer.shape[1] // 2
+            coarser = finer[: 2 * nx, : 2 * ny].reshape(nx, 2, ny, 2, *finer.shape[2:])
+            self.mipmap.append(
+                coarser.mean(axis=(1, 3), dtype=np.float32)
+                if np.isrealobj(finer)
+                else coarser.mean(axis=(1, 3))
+            )
+        return self.mipmap[k]
+
+    def update_tiles(self, *args):
+        """
+        Upload the part of the image in view, at the coarsest level with at
+        least one pixel per screen pixel, if it is not already displayed.
+        """
+        if self.image is None:
+            return
+        nx, ny = self.image.shape[:2]
+
+        # the image's extent in the view, as set by setRect
+        rect = self.reference_item.mapRectToParent(self.reference_item.boundingRect())
+        sx, sy = rect.width() / nx, rect.height() / ny
+
+        if max(nx, ny) <= LOD_MIN_SIZE:
+            k, tile, tiles = 0, max(nx, ny), (0, 1, 0, 1)
+        else:
+            k = 0
+            pixel_size = self.view.viewPixelSize()
+            if pixel_size is not None and min(pixel_size) > 0:
+                # screen pixel size in image pixels
+                size = min(pixel_size[0] / sx, pixel_size[1] / sy)
+                k = int(np.floor(np.log2(max(size, 1.0))))
+                k = min(k, int(np.log2(max(nx, ny) / LOD_TILE_SIZE)))
+                k = min(k, int(np.log2(min(nx, ny))))
+
+            # the tiles of level k that overlap the visible range, counted
+            # from the level itself, which drops odd rows and columns
+            tile = LOD_TILE_SIZE
+            span = tile * 2**k
+            (x0, x1), (y0, y1) = self.view.viewRange()
+            x0, x1 = sorted(((x0 - rect.left()) / sx, (x1 - rect.left()) / sx))
+            y0, y1 = sorted(((y0 - rect.top()) / sy, (y1 - rect.top()) / sy))
+            lx, ly = self.get_level(k).shape[:2]
+            tx, ty = max(1, -(-lx // tile)), max(1, -(-ly // tile))
+            tiles = (
+                int(np.clip(np.floor(x0 / span), 0, tx - 1)),
+                int(np.clip(np.ceil(x1 / span), 1, tx)),
+                int(np.clip(np.floor(y0 / span), 0, ty - 1)),
+                int(np.clip(np.ceil(y1 / span), 1, ty)),
+            )
+
+        if self.displayed == (k, tiles, rect):
+            return
+        self.displayed = (k, tiles, rect)
+
+        tx0, tx1, ty0, ty1 = tiles
+        crop = self.get_level(k)[tx0 * tile : tx1 * tile, ty0 * tile : ty1 * tile]
+        if crop.shape[0] == 0 or crop.shape[1] == 0:
+            # a side of the image shorter than 2**k has no pixels at level k
+            self.imageItem.clear()
+            return
+        self.imageItem.setImage(crop, autoLevels=False, levels=self.levels)
+        scale = 2**k
+        self.imageItem.setRect(
+            QRectF(
+                rect.left() + tx0 * tile * scale * sx,
+                rect.top() + ty0 * tile * scale * sy,
+                crop.shape[0] * scale * sx,
+                crop.shape[1] * scale * sy,
+            )
+        )
+
+    def setRect(self, *rect):
+        # Place the image at rect in the view, in place of one view unit
+        # per pixel
+        self.reference_item.setRect(*rect)
+        self.update_tiles()
+
+    def get_statistics(self):
+        # min, max and histogram of a subsample of the image, cached until
+        # the image changes
+        if self.statistics is None:
+            step = max(1, int(np.ceil(np.sqrt(self.image.size / STATISTICS_PIXELS))))
+            sample = np.asarray(self.image[::step, ::step], dtype=np.float64)
+            sample = sample[np.isfinite(sample)]
+            if sample.size == 0:
+                self.statistics = (0.0, 1.0, None)
+            else:
+                mn, mx = float(sample.min()), float(sample.max())
+                counts, edges = np.histogram(sample, bins=256)
+                self.statistics = (mn, mx, (edges[:-1], counts))
+        return self.statistics
+
+    def update_histogram(self):
+        if self.image is None:
+            return
+        mn, mx, hist = self.get_statistics()
+        self.updating_histogram = True
+        if self.histogram_stale:
+            if hist is not None:
+                self.histogram.item.plot.setData(*hist, stepMode=None)
+            self.histogram_stale = False
+        self.histogram.item.setLevels(*self.levels)
+        self.updating_histogram = False
+
+    def histogram_levels_changed(self):
+        # Levels dragged in the panel by the user
+        if not self.updating_histogram:
+            self.levels = tuple(self.histogram.item.getLevels())
+            self.imageItem.setLevels(self.levels)
+
+    def histogram_lookup_table_changed(self):
+        item = self.histogram.item
+        self.imageItem.setLookupTable(
+            None if item.gradient.isLookupTrivial() else item.getLookupTable(n=512)
+        )
+
+    def setLevelsPanelVisible(self, visible):
+        self.histogram.setVisible(visible)
+        if visible:
+            self.update_histogram()
+
+    def getLevels(self):
+        return self.levels
+
+    def setLevels(self, min, max):
+        self.levels = (min, max)
+        self.imageItem.setLevels(self.levels)
+        if not self.histogram.isHidden():
+            self.update_histogram()
+
+    def autoLevels(self):
+        if self.image is not None:
+            self.setLevels(*self.get_statistics()[:2])
+
+    def autoRange(self):
+        self.view.autoRange(items=[self.reference_item])
@@ -0,0 +1,256 @@
+"""
+Live viewing of an acquisition in progress. A stream reports how many
+frames have arrived so far and hands them out in order; ingest_live copies
+new frames into a preallocated datacube and keeps the virtual image and
+summed diffraction pattern up to date incrementally, closing the stream
+when it stops.
+"""
+
+import numpy as np
+import h5py
+import os
+import socket
+import threading
+import time
+
+from py4D_browser.utils import memmap_frames, masked_sum, accumulator_dtype
+
+
+class RawFileStream:
+    """Frames appended to a raw binary file, laid out as for memmap_frames"""
+
+    closed = False
+
+    def __init__(
+        self, filepath, dtype, frame_shape, offset=0, frame_header=0, frame_padding=0
+    ):
+        self.filepath = filepath
+        self.dtype = np.dtype(dtype)
+        self.frame_shape = tuple(frame_shape)
+        self.offset = offset
+        self.frame_header = frame_header
+        self.frame_padding = frame_padding
+        self.frame_stride = (
+            frame_header
+            + int(np.prod(frame_shape)) * self.dtype.itemsize
+            + frame_padding
+        )
+
+    def available(self):
+        if not os.path.exists(self.filepath):
+            return 0
+        return max(0, os.path.getsize(self.filepath) - self.offset) // self.frame_stride
+
+    def read(self, start, stop):
+        # the file grows, so it is mapped afresh up to the frames needed
+        frames = memmap_frames(
+            self.filepath,
+            self.dtype,
+            self.frame_shape,
+            offset=self.offset,
+            frame_header=self.frame_header,
+            frame_padding=self.frame_padding,
+            n_frames=stop,
+        )
+        return np.array(frames[start:stop])
+
+    def close(self):
+        # the file is only mapped while reading
+        pass
+
+
+class HDF5Stream:
+    """
+    Frames appended along the first axis of a resizable 3D dataset. Files
+    written in SWMR mode are read as they grow; others are reopened on
+    every poll, which is only safe if the writer flushes whole frames.
+    """
+
+    closed = False
+
+    def __init__(self, filepath, name=None):
+        self.filepath = filepath
+        self.name = name
+        self.file = None
+        self.open()
+        self.dtype = self.dataset.dtype
+        self.frame_shape = self.dataset.shape[1:]
+
+    def open(self):
+        try:
+            self.file = h5py.File(self.filepath, "r", libver="latest", swmr=True)
+            self.swmr = True
+        except OSError:
+            self.file = h5py.File(self.filepath, "r")
+            self.swmr = False
+        if self.name is None:
+            # the first dataset that looks like a stack of frames
+            found = []
+            self.file.visititems(
+                lambda name, obj: (
+                    found.append(obj.name)
+                    if isinstance(obj, h5py.Dataset) and obj.ndim == 3
+                    else None
+                )
+            )
+            if not found:
+                self.close()
+                raise ValueError("No stack of frames found in the HDF5 file")
+            self.name = found[0]
+        self.dataset = self.file[self.name]
+
+    def available(self):
+        if self.swmr:
+            self.dataset.refresh()
+        else:
+            self.file.close()
+            self.open()
+        return self.dataset.shape[0]
+
+    def read(self, start, stop):
+        return self.dataset[start:stop]
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class SocketStream:
+    """
+    Frames sent back to back as raw bytes over a TCP connection, as a
+    stand-in for a detector's data stream.
+    """
+
+    def __init__(self, host, port, dtype, frame_shape):
+        self.dtype = np.dtype(dtype)
+        self.frame_shape = tuple(frame_shape)
+        self.frame_bytes = int(np.prod(frame_shape)) * self.dtype.itemsize
+        self.connection = socket.create_connection((host, port), timeout=5)
+        self.connection.setblocking(False)
+        self.buffer = bytearray()
+        self.consumed = 0
+        self.closed = False
+
+    def available(self):
+        while not self.closed:
+            try:
+                received = self.connection.recv(2**20)
+            except BlockingIOError:
+                break
+            if not received:
+                self.closed = True
+                self.connection.close()
+            self.buffer += received
+        return self.consumed + len(self.buffer) // self.frame_bytes
+
+    def read(self, start, stop):
+        # frames are handed out once, in order
+        assert start == self.consumed, "Socket frames must be read in order"
+        nbytes = (stop - start) * self.frame_bytes
+        frames = np.frombuffer(bytes(self.buffer[:nbytes]), dtype=self.dtype)
+        del self.buffer[:nbytes]
+        self.consumed = stop
+        return frames.reshape(stop - start, *self.frame_shape)
+
+    def close(self):
+        self.closed = True
+        self.connection.close()
+
+
+def open_live_stream(options):
+    if options["source"] == "Raw File":
+        return RawFileStream(
+            options["path"],
+            options["dtype"],
+            options["frame_shape"],
+            offset=options["offset"],
+            frame_header=options["frame_header"],
+            frame_padding=options["frame_padding"],
+        )
+    if options["source"] == "HDF5 File":
+        return HDF5Stream(options["path"])
+    host, _, port = options["path"].rpartition(":")
+    return SocketStream(
+        host or "localhost", int(port), options["dtype"], options["frame_shape"]
+    )
+
+
+class LiveAcquisition:
+    """
+    A datacube being filled in raster order, with running reductions: the
+    virtual image of the current detector mask (computed with reduce) and
+    the sum of all diffraction patterns received.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.frames = data.reshape(-1, *data.shape[2:])
+        self.filled = 0
+        self.mask = None
+        self.reduce = masked_sum
+        self.vimg = np.zeros(self.frames.shape[0])
+        self.dp_sum = np.zeros(data.shape[2:], dtype=accumulator_dtype(data.dtype))
+        self.lock = threading.Lock()
+
+    def append(self, frames):
+        with self.lock:
+            new = slice(self.filled, self.filled + frames.shape[0])
+            self.frames[new] = frames
+            if self.mask is not None:
+                self.vimg[new] = self.reduce(frames[None], self.mask)[0]
+            self.dp_sum += frames.sum(axis=0, dtype=self.dp_sum.dtype)
+            self.filled = new.stop
+
+    def set_detector(self, mask, reduce):
+        # A new detector needs the frames received so far reduced once
+        with self.lock:
+            self.mask = mask
+            self.reduce = reduce
+            self.vimg[:] = 0
+            if self.filled > 0:
+                self.vimg[: self.filled] = reduce(
+                    self.frames[None, : self.filled], mask
+                )[0]
+
+    def has_detector(self, mask, reduce):
+        if reduce is not self.reduce or type(mask) is not type(self.mask):
+            return False
+        if isinstance(mask, tuple):
+            return mask == self.mask
+        return np.array_equal(mask, self.mask)
+
+    @property
+    def virtual_image(self):
+        with self.lock:
+            return self.vimg.reshape(self.data.shape[:2]).copy()
+
+    @property
+    def mean_diffraction(self):
+        with self.lock:
+            return self.dp_sum / max(self.filled, 1)
+
+
+def ingest_live(task, stream, live, poll_interval=0.1, block_frames=1024):
+    """
+    Copy frames from stream into live as they arrive, publishing the number
+    of frames received after every block. Runs until the datacube is full,
+    the stream closes, or the task is cancelled, and then closes the stream.
+    """
+    total = live.frames.shape[0]
+    try:
+        while live.filled < total:
+            task.check_cancelled()
+            available = min(stream.available(), total)
+            if available > live.filled:
+                stop = min(available, live.filled + block_frames)
+                live.append(stream.read(live.filled, stop))
+                task.publish(live.filled)
+                task.report(f"Live: {live.filled}/{total} frames")
+            elif stream.closed:
+                break
+            else:
+                time.sleep(poll_interval)
+    finally:
+        stream.close()
+    return live.filled
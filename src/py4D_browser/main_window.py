@@ -6,6 +6,8 @@ from PyQt5.QtWidgets import (
     QMenu,
     QAction,
     QHBoxLayout,
+    QVBoxLayout,
+    QSlider,
     QSplitter,
     QActionGroup,
     QLabel,
@@ -24,8 +26,9 @@ import importlib
 import os
 import platformdirs
 
-from py4D_browser.utils import pg_point_roi, VLine, LatchingButton
+from py4D_browser.utils import pg_point_roi, VLine, LatchingButton, BackgroundTask
 from py4D_browser.scalebar import ScaleBar
+from py4D_browser.image_view import LightImageView
 
 
 class DataViewer(QMainWindow):
@@ -39,10 +42,27 @@ class DataViewer(QMainWindow):
 
     from py4D_browser.menu_actions import (
         load_file,
+        load_array,
         load_data_arina,
         load_data_auto,
         load_data_bin,
+        load_data_region,
+        load_region,
+        fill_progressively,
+        cancel_load,
+        choose_load_mode,
+        get_memory_budget,
+        set_memory_budget,
+        load_into_ram,
+        start_live_acquisition,
+        load_time_series,
+        set_time_step,
+        clear_time_series,
+        compute_virtual_image_time_series,
         load_data_mmap,
+        load_data_zarr,
+        load_data_raw,
+        convert_to_sparse,
         show_file_dialog,
         get_savefile_name,
         export_datacube,
@@ -62,6 +82,7 @@ class DataViewer(QMainWindow):
         _render_diffraction_image,
         update_diffraction_space_view,
         update_real_space_view,
+        get_virtual_detector_mask,
         update_realspace_detector,
         update_diffraction_detector,
         set_diffraction_autoscale_range,
@@ -73,12 +94,15 @@ class DataViewer(QMainWindow):
         update_tooltip,
     )
 
+    HAS_ZARR = importlib.util.find_spec("zarr") is not None
+
     HAS_EMPAD2 = importlib.util.find_spec("empad2") is not None
     if HAS_EMPAD2:
         from py4D_browser.empad2_reader import (
             set_empad2_sensor,
             load_empad2_background,
             load_empad2_dataset,
+            convert_empad2_dataset,
         )
 
     def __init__(self, argv):
@@ -98,6 +122,11 @@ class DataViewer(QMainWindow):
         self.setAcceptDrops(True)
 
         self.datacube = None
+        self.tcBF_cache = None
+        self.tcBF_task = None
+        self.background_tasks = []
+        self.load_task = None
+        self.time_series = None
 
         # Load settings from cofig file
         config_path = os.path.join(
@@ -163,14 +192,43 @@ class DataViewer(QMainWindow):
         self.load_binned_action.triggered.connect(self.load_data_bin)
         self.file_menu.addAction(self.load_binned_action)
 
+        self.load_region_action = QAction("Load Re&gion...", self)
+        self.load_region_action.triggered.connect(self.load_data_region)
+        self.file_menu.addAction(self.load_region_action)
+
         self.load_arina_action = QAction("Load &Arina Data...", self)
         self.load_arina_action.triggered.connect(self.load_data_arina)
         self.file_menu.addAction(self.load_arina_action)
 
+        self.load_raw_action = QAction("Load Ra&w Binary...", self)
+        self.load_raw_action.triggered.connect(self.load_data_raw)
+        self.file_menu.addAction(self.load_raw_action)
+
+        if self.HAS_ZARR:
+            self.load_zarr_action = QAction("Load &Zarr Store...", self)
+            self.load_zarr_action.triggered.connect(self.load_data_zarr)
+            self.file_menu.addAction(self.load_zarr_action)
+
+        self.live_action = QAction("Li&ve Acquisition...", self)
+        self.live_action.triggered.connect(self.start_live_acquisition)
+        self.file_menu.addAction(self.live_action)
+
         self.reshape_data_action = QAction("&Reshape Data...", self)
         self.reshape_data_action.triggered.connect(self.reshape_data)
         self.file_menu.addAction(self.reshape_data_action)
 
+        self.load_into_ram_action = QAction("Load into R&AM", self)
+        self.load_into_ram_action.triggered.connect(self.load_into_ram)
+        self.file_menu.addAction(self.load_into_ram_action)
+
+        self.memory_budget_action = QAction("Memory &Budget...", self)
+        self.memory_budget_action.triggered.connect(self.set_memory_budget)
+        self.file_menu.addAction(self.memory_budget_action)
+
+        self.convert_sparse_action = QAction("Convert to &Electron Events", self)
+        self.convert_sparse_action.triggered.connect(self.convert_to_sparse)
+        self.file_menu.addAction(self.convert_sparse_action)
+
         self.file_menu.addSeparator()
 
         export_label = QAction("Export", self)
@@ -180,7 +238,10 @@ class DataViewer(QMainWindow):
         # Submenu to export datacube
         datacube_export_menu = QMenu("Export Datacube", self)
         self.file_menu.addMenu(datacube_export_menu)
-        for method in ["Raw float32", "py4DSTEM HDF5", "Plain HDF5"]:
+        export_formats = ["Raw float32", "py4DSTEM HDF5", "Plain HDF5"]
+        if self.HAS_ZARR:
+            export_formats.append("Zarr")
+        for method in export_formats:
             menu_item = datacube_export_menu.addAction(method)
             menu_item.triggered.connect(partial(self.export_datacube, method))
             if method == "py4DSTEM HDF5":
@@ -229,6 +290,9 @@ class DataViewer(QMainWindow):
             self.empad2_menu.addAction("Load &Dataset...").triggered.connect(
                 self.load_empad2_dataset
             )
+            self.empad2_menu.addAction("&Convert to HDF5...").triggered.connect(
+                self.convert_empad2_dataset
+            )
 
         # Scaling Menu
         self.scaling_menu = QMenu("&Scaling", self)
@@ -304,6 +368,17 @@ class DataViewer(QMainWindow):
         vimg_scaling_group.addAction(vimg_scale_sqrt_action)
         self.scaling_menu.addAction(vimg_scale_sqrt_action)
 
+        self.scaling_menu.addSeparator()
+
+        # Histograms are only computed while the levels panels are shown
+        self.levels_panel_action = QAction("Show &Levels Panels", self)
+        self.levels_panel_action.setCheckable(True)
+        self.levels_panel_action.setChecked(
+            self.settings.value("last_state/show_levels", False, type=bool)
+        )
+        self.levels_panel_action.toggled.connect(self.set_levels_panels_visible)
+        self.scaling_menu.addAction(self.levels_panel_action)
+
         # Autorange menu
         self.autorange_menu = QMenu("&Autorange", self)
         self.menu_bar.addMenu(self.autorange_menu)
@@ -543,10 +618,14 @@ class DataViewer(QMainWindow):
         tcBF_action_manual.triggered.connect(self.reconstruct_tcBF_manual)
         self.processing_menu.addAction(tcBF_action_manual)
 
-        tcBF_action_auto = QAction("tcBF (Automatic)", self)
-        tcBF_action_auto.triggered.connect(self.reconstruct_tcBF_auto)
-        self.processing_menu.addAction(tcBF_action_auto)
-        # tcBF_action_auto.setEnabled(False)
+        self.tcBF_action_auto = QAction("tcBF (Automatic)...", self)
+        self.tcBF_action_auto.triggered.connect(self.reconstruct_tcBF_auto)
+        self.processing_menu.addAction(self.tcBF_action_auto)
+
+        time_series_action = QAction("&Virtual Image Time Series", self)
+        time_series_action.triggered.connect(self.compute_virtual_image_time_series)
+        self.processing_menu.addAction(time_series_action)
+        # self.tcBF_action_auto.setEnabled(False)
 
         # Help menu
         self.help_menu = QMenu("&Help", self)
@@ -558,7 +637,7 @@ class DataViewer(QMainWindow):
 
     def setup_views(self):
         # Set up the diffraction space window.
-        self.diffraction_space_widget = pg.ImageView()
+        self.diffraction_space_widget = LightImageView()
         self.diffraction_space_widget.setImage(np.zeros((512, 512)))
 
         self.diffraction_space_widget.setMouseTracking(True)
@@ -577,7 +656,7 @@ class DataViewer(QMainWindow):
         self.diffraction_space_widget.setWindowTitle("Diffraction Space")
 
         # Set up the real space window.
-        self.real_space_widget = pg.ImageView()
+        self.real_space_widget = LightImageView()
         self.real_space_widget.setImage(np.zeros((512, 512)))
 
         # Add point selector connected to displayed diffraction pattern
@@ -599,7 +678,7 @@ class DataViewer(QMainWindow):
         self.real_space_widget.dropEvent = self.dropEvent
 
         # Set up the FFT window.
-        self.fft_widget = pg.ImageView()
+        self.fft_widget = LightImageView()
         self.fft_widget.setImage(np.zeros((512, 512)))
 
         # FFT scale bar
@@ -627,14 +706,33 @@ class DataViewer(QMainWindow):
         rightside.setStretchFactor(0, 2)
         layout.addWidget(rightside, 1)
 
+        # Time slider, shown for 5D time series
+        self.time_bar = QWidget()
+        time_layout = QHBoxLayout(self.time_bar)
+        time_layout.addWidget(QLabel("Time Step"))
+        self.time_slider = QSlider(QtCore.Qt.Horizontal)
+        # steps are loaded when the slider is released, not while dragging
+        self.time_slider.setTracking(False)
+        self.time_slider.valueChanged.connect(self.set_time_step)
+        time_layout.addWidget(self.time_slider, 1)
+        self.time_label = QLabel("")
+        time_layout.addWidget(self.time_label)
+        self.time_bar.hide()
+
+        main_layout = QVBoxLayout()
+        main_layout.addLayout(layout, 1)
+        main_layout.addWidget(self.time_bar)
+
         widget = QWidget()
-        widget.setLayout(layout)
+        widget.setLayout(main_layout)
         self.setCentralWidget(widget)
 
         self.diffraction_space_widget.getView().setMenuEnabled(False)
         self.real_space_widget.getView().setMenuEnabled(False)
         self.fft_widget.getView().setMenuEnabled(False)
 
+        self.set_levels_panels_visible(self.levels_panel_action.isChecked())
+
         # Setup Status Bar
         self.stats_button = QPushButton("Statistics")
         self.stats_menu = QMenu()
@@ -657,11 +755,16 @@ class DataViewer(QMainWindow):
 
         self.stats_button.setMenu(self.stats_menu)
 
+        self.cancel_task_button = QPushButton("Cancel")
+        self.cancel_task_button.clicked.connect(self.cancel_background_tasks)
+        self.cancel_task_button.hide()
+
         self.cursor_value_text = QLabel("")
         self.diffraction_space_view_text = QLabel("Slice")
         self.real_space_view_text = QLabel("Scan Position")
 
         # self.statusBar().addPermanentWidget(VLine())
+        self.statusBar().addPermanentWidget(self.cancel_task_button)
         self.statusBar().addPermanentWidget(self.cursor_value_text)
         self.statusBar().addPermanentWidget(VLine())
         self.statusBar().addPermanentWidget(self.stats_button)
@@ -689,6 +792,59 @@ class DataViewer(QMainWindow):
         )
         self.statusBar().addPermanentWidget(self.realspace_rescale_button)
 
+    def set_levels_panels_visible(self, visible):
+        for widget in (
+            self.diffraction_space_widget,
+            self.real_space_widget,
+            self.fft_widget,
+        ):
+            widget.setLevelsPanelVisible(visible)
+        self.settings.setValue("last_state/show_levels", visible)
+
+    def run_in_background(self, function, *args, on_success=None, description=""):
+        """
+        Run function(task, *args) in a BackgroundTask, showing its progress in
+        the status bar along with a button to cancel it. on_success is called
+        on the GUI thread with the return value of function.
+        """
+        task = BackgroundTask(function, *args, parent=self)
+        task.progress.connect(
+            lambda message: self.statusBar().showMessage(message, 2_000)
+        )
+        if on_success is not None:
+            task.succeeded.connect(on_success)
+        task.failed.connect(
+            lambda message: self.statusBar().showMessage(
+                f"{description} failed: {message}", 10_000
+            )
+        )
+        task.finished.connect(partial(self.background_task_finished, task, description))
+
+        self.background_tasks.append(task)
+        self.cancel_task_button.show()
+        self.statusBar().showMessage(f"{description}...")
+        task.start()
+        return task
+
+    def background_task_finished(self, task, description):
+        if task in self.background_tasks:
+            self.background_tasks.remove(task)
+        if task.cancelled:
+            self.statusBar().showMessage(f"{description} cancelled", 5_000)
+        if len(self.background_tasks) == 0:
+            self.cancel_task_button.hide()
+
+    def cancel_background_tasks(self):
+        for task in self.background_tasks:
+            task.cancel()
+
+    def closeEvent(self, event):
+        # worker threads have to finish before their QThread is destroyed
+        self.cancel_background_tasks()
+        for task in list(self.background_tasks):
+            task.wait()
+        super().closeEvent(event)
+
     def resizeEvent(self, event):
         # Store window size for next run
         self.settings.setValue("last_state/window_size", event.size())
@@ -1,14 +1,74 @@
 from numbers import Real
 import py4DSTEM
-from PyQt5.QtWidgets import QFileDialog, QMessageBox
+from PyQt5.QtWidgets import QFileDialog, QMessageBox, QInputDialog
 import h5py
 import os
 import numpy as np
 import matplotlib.pyplot as plt
+import pyqtgraph as pg
 from py4D_browser.help_menu import KeyboardMapMenu
-from py4D_browser.dialogs import CalibrateDialog, ResizeDialog, ManualTCBFDialog
-from py4D_browser.utils import make_detector
-from py4DSTEM.io.filereaders import read_arina
+from py4D_browser.dialogs import (
+    CalibrateDialog,
+    ResizeDialog,
+    ManualTCBFDialog,
+    AutoTCBFDialog,
+    CompressionDialog,
+    LoadRegionDialog,
+    BinDialog,
+    DatasetPickerDialog,
+    RawBinaryDialog,
+    LiveAcquisitionDialog,
+)
+from py4D_browser.utils import (
+    make_detector,
+    masked_sum,
+    masked_max,
+    iter_scan_blocks,
+    read_region,
+    memmap_frames,
+    ScanFrames,
+    TaskCancelled,
+)
+from py4D_browser import hdf5_parallel
+from py4D_browser.npz_io import index_npz, open_npz_array
+from py4D_browser.time_series import TimeSeries
+from py4D_browser.live import LiveAcquisition, open_live_stream, ingest_live
+from py4D_browser.sparse import (
+    ElectronEventCube,
+    find_electron_events,
+    read_electron_events,
+)
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, lru_cache
+import copy
+import importlib
+import itertools
+import zlib
+import time
+import weakref
+
+HAS_HDF5PLUGIN = importlib.util.find_spec("hdf5plugin") is not None
+if HAS_HDF5PLUGIN:
+    # importing registers the Blosc, LZ4, Zstd and Bitshuffle filters with h5py
+    import hdf5plugin
+
+HAS_PSUTIL = importlib.util.find_spec("psutil") is not None
+if HAS_PSUTIL:
+    import psutil
+
+# Size of the HDF5 chunk cache for datasets that are read lazily
+LAZY_CHUNK_CACHE_BYTES = 256 * 2**20
+
+# Time steps cached when the available memory is unknown
+TIME_SERIES_CACHE_BYTES = 2 * 2**30
+
+HAS_BLOSC = importlib.util.find_spec("blosc") is not None
+if HAS_BLOSC:
+    import blosc
+
+HAS_ZSTANDARD = importlib.util.find_spec("zstandard") is not None
+if HAS_ZSTANDARD:
+    import zstandard
 
 
 def load_data_auto(self):
@@ -22,83 +82,352 @@ def load_data_mmap(self):
 
 
 def load_data_bin(self):
-    # TODO: Ask user for binning level
     filename = self.show_file_dialog()
-    self.load_file(filename, mmap=False, binning=4)
+    source, calibrations = open_datacube_source(filename, parent=self)
 
+    options = BinDialog.get_options(source.shape, source.dtype, parent=self)
+    if options is None:
+        return
 
-def load_data_arina(self):
+    self.load_region(filename, source, calibrations, options)
+
+
+def load_data_region(self):
     filename = self.show_file_dialog()
-    dataset = read_arina(filename)
-
-    # Try to reshape the data to be square
-    N_patterns = dataset.data.shape[1]
-    Nxy = np.sqrt(N_patterns)
-    if np.abs(Nxy - np.round(Nxy)) <= 1e-10:
-        Nxy = int(Nxy)
-        dataset.data = dataset.data.reshape(
-            Nxy, Nxy, dataset.data.shape[2], dataset.data.shape[3]
-        )
+    source, calibrations = open_datacube_source(filename, parent=self)
+
+    options = LoadRegionDialog.get_options(source.shape, source.dtype, parent=self)
+    if options is None:
+        return
+
+    self.load_region(filename, source, calibrations, options)
+
+
+def load_region(self, filename, source, calibrations, options):
+    # Read (and bin) the requested part of source on a background task
+    self.cancel_load()
+
+    def show_region(data):
+        self.datacube = py4DSTEM.DataCube(data)
+
+        R_size, R_units, Q_size, Q_units = calibrations
+
+        self.datacube.calibration.set_R_pixel_size(R_size * options["scan_bin"])
+        self.datacube.calibration.set_R_pixel_units(R_units)
+        self.datacube.calibration.set_Q_pixel_size(Q_size * options["diffraction_bin"])
+        self.datacube.calibration.set_Q_pixel_units(Q_units)
+
+        self.update_scalebars()
+
+        self.update_diffraction_space_view(reset=True)
+        self.update_real_space_view(reset=True)
+
+        self.setWindowTitle(filename)
+
+    self.load_task = self.run_in_background(
+        lambda task, *args: read_region(*args, task=task),
+        source,
+        options["region"],
+        options["scan_bin"],
+        options["diffraction_bin"],
+        options["reduce"],
+        options["dtype"],
+        on_success=show_region,
+        description=f"Loading {filename}",
+    )
+
+
+def open_datacube_source(filepath, parent=None):
+    """
+    Open the 4D data in filepath without reading it into memory. Returns an
+    array-like that reads only the parts sliced from it, along with the
+    calibrations (R_size, R_units, Q_size, Q_units). If parent is given, the
+    user picks among several datacubes in an HDF5 file.
+    """
+    extension = os.path.splitext(filepath)[-1].lower()
+    if extension in (".h5", ".hdf5", ".py4dstem", ".emd", ".mat"):
+        entry = choose_hdf5_dataset(parent, filepath)
+        if entry is None:
+            raise ValueError("No 4D data selected in the H5 file!")
+        file = h5py.File(filepath, "r")
+        return file[entry["name"]], entry["calibrations"]
+    elif extension == ".zarr" or os.path.isdir(filepath):
+        from py4D_browser.zarr_io import open_zarr, find_zarr_calibrations
+
+        array = open_zarr(filepath)
+        if array is None:
+            raise ValueError("No 4D data detected in the Zarr store!")
+        return array, find_zarr_calibrations(array)
+    elif extension == ".mib":
+        from py4D_browser.mib_io import open_mib
+
+        return open_mib(filepath), (1.0, "pixels", 1.0, "pixels")
+    elif extension in [".npy"]:
+        return np.load(filepath, mmap_mode="r"), (1.0, "pixels", 1.0, "pixels")
+    elif extension == ".npz":
+        entry = choose_npz_array(parent, filepath)
+        if entry is None or len(entry["shape"]) != 4:
+            raise ValueError("No 4D data selected in the NPZ file!")
+        return open_npz_array(filepath, entry), (1.0, "pixels", 1.0, "pixels")
     else:
+        # raw and vendor formats are memory mapped by their py4DSTEM readers
+        datacube = py4DSTEM.import_file(filepath, mem="MEMMAP")
+        return datacube.data, (
+            datacube.calibration.get_R_pixel_size(),
+            datacube.calibration.get_R_pixel_units(),
+            datacube.calibration.get_Q_pixel_size(),
+            datacube.calibration.get_Q_pixel_units(),
+        )
+
+
+def load_data_zarr(self):
+    filepath = QFileDialog.getExistingDirectory(self, "Open Zarr Store")
+    if len(filepath) == 0:
+        raise ValueError("Could not read file")
+    # Zarr stores are read lazily, with chunks fetched concurrently
+    self.load_file(filepath, mmap=True)
+
+
+def load_data_arina(self):
+    from py4D_browser.arina_io import ArinaChunkReader, find_arina_calibrations
+
+    filename = self.show_file_dialog()
+
+    # Only the chunk index is read here; frames are decompressed on demand
+    self.cancel_load()
+    reader = ArinaChunkReader(filename)
+    if reader.scan_shape[0] == 1:
         self.statusBar().showMessage(
-            f"The scan appears to not be square! Found {N_patterns} patterns", 5_000
+            f"The scan appears to not be square! Found {reader.scan_shape[1]} patterns",
+            5_000,
         )
 
-    self.datacube = dataset
-    self.diffraction_scale_bar.pixel_size = self.datacube.calibration.get_Q_pixel_size()
-    self.diffraction_scale_bar.units = self.datacube.calibration.get_Q_pixel_units()
+    self.datacube = py4DSTEM.DataCube(reader)
 
-    self.real_space_scale_bar.pixel_size = self.datacube.calibration.get_R_pixel_size()
-    self.real_space_scale_bar.units = self.datacube.calibration.get_R_pixel_units()
+    R_size, R_units = find_arina_calibrations(filename)
+    self.datacube.calibration.set_R_pixel_size(R_size)
+    self.datacube.calibration.set_R_pixel_units(R_units)
 
-    self.fft_scale_bar.pixel_size = (
-        1.0 / self.datacube.calibration.get_R_pixel_size() / self.datacube.R_Ny
+    self.update_scalebars()
+
+    self.update_diffraction_space_view(reset=True)
+    self.update_real_space_view(reset=True)
+
+    self.setWindowTitle(filename)
+
+
+def load_data_raw(self):
+    filename = self.show_file_dialog()
+    options = RawBinaryDialog.get_options(os.path.getsize(filename), parent=self)
+    if options is None:
+        return
+
+    # Frames are mapped in place, stepping over any per-frame header/padding
+    self.cancel_load()
+    frames = memmap_frames(
+        filename,
+        options["dtype"],
+        options["frame_shape"],
+        offset=options["offset"],
+        frame_header=options["frame_header"],
+        frame_padding=options["frame_padding"],
     )
-    self.fft_scale_bar.units = f"1/{self.datacube.calibration.get_R_pixel_units()}"
+    n_frames = int(np.prod(options["scan_shape"]))
+    array = frames[:n_frames].reshape(*options["scan_shape"], *options["frame_shape"])
+    self.statusBar().showMessage(
+        f"Mapped raw frames with shape {array.shape} and dtype {array.dtype}", 5_000
+    )
+
+    mmap = self.choose_load_mode(array.nbytes) != "RAM"
+    self.datacube = py4DSTEM.DataCube(array if mmap else preallocate(array))
+
+    self.update_scalebars()
 
     self.update_diffraction_space_view(reset=True)
     self.update_real_space_view(reset=True)
 
     self.setWindowTitle(filename)
 
+    if not mmap:
+        self.fill_progressively(array, filename)
+
+
+def load_array(
+    self,
+    data,
+    R_pixel_size=None,
+    R_pixel_units=None,
+    Q_pixel_size=None,
+    Q_pixel_units=None,
+    title="Array",
+):
+    """
+    Show an in-memory 4D array, memory map or array-like, or a py4DSTEM
+    DataCube, without copying it. 5D arrays are shown as time series. A
+    DataCube keeps its own calibration unless a calibration is passed.
+    """
+    self.cancel_load()
+
+    if isinstance(data, py4DSTEM.DataCube):
+        self.datacube = data
+    elif len(data.shape) == 4:
+        self.datacube = py4DSTEM.DataCube(data)
+    elif len(data.shape) == 5:
+        self.load_time_series(data)
+    else:
+        raise ValueError(f"Expected 4D or 5D data, got shape {tuple(data.shape)}")
+
+    calibration = self.datacube.calibration
+    if R_pixel_size is not None:
+        calibration.set_R_pixel_size(R_pixel_size)
+    if R_pixel_units is not None:
+        calibration.set_R_pixel_units(R_pixel_units)
+    if Q_pixel_size is not None:
+        calibration.set_Q_pixel_size(Q_pixel_size)
+    if Q_pixel_units is not None:
+        calibration.set_Q_pixel_units(Q_pixel_units)
+
+    self.update_scalebars()
+
+    self.update_diffraction_space_view(reset=True)
+    self.update_real_space_view(reset=True)
 
-def load_file(self, filepath, mmap=False, binning=1):
+    self.setWindowTitle(title)
+
+
+def load_file(self, filepath, mmap=None, binning=1):
+    # mmap=None picks between loading into RAM, memory mapping and lazy
+    # chunked reads from the size of the data and the memory budget
+    self.cancel_load()
     print(f"Loading file {filepath}")
     extension = os.path.splitext(filepath)[-1].lower()
     print(f"Type: {extension}")
+
+    # Sources read into RAM on a background task after the window is set up
+    source = None
     if extension in (".h5", ".hdf5", ".py4dstem", ".emd", ".mat"):
         file = h5py.File(filepath, "r")
-        datacubes = get_ND(file)
-        print(f"Found {len(datacubes)} 4D datasets inside the HDF5 file...")
-        if len(datacubes) >= 1:
-            # Read the first datacube in the HDF5 file into RAM
-            print(f"Reading dataset at location {datacubes[0].name}")
-            self.datacube = py4DSTEM.DataCube(
-                datacubes[0] if mmap else datacubes[0][()]
-            )
+        events = find_electron_events(file)
+        if events is not None:
+            # Counted data is kept as event lists rather than densified
+            print(f"Reading electron events at location {events.name}")
+            self.datacube = py4DSTEM.DataCube(read_electron_events(events))
+        elif any(len(e["shape"]) in (4, 5) for e in index_hdf5(filepath)):
+            entry = choose_hdf5_dataset(self, filepath, N=(4, 5))
+            if entry is None:
+                return
+
+            print(f"Reading dataset at location {entry['name']}")
+            dataset = file[entry["name"]]
+            if dataset.ndim == 5:
+                self.load_time_series(dataset)
+            else:
+                if mmap is None:
+                    mode = self.choose_load_mode(
+                        dataset.nbytes, dataset.chunks is not None
+                    )
+                    mmap = mode != "RAM"
+                    if mode == "LAZY":
+                        # a chunk cache big enough to hold a scan row of chunks
+                        file = h5py.File(
+                            filepath, "r", rdcc_nbytes=LAZY_CHUNK_CACHE_BYTES
+                        )
+                        dataset = file[entry["name"]]
+                source = None if mmap else dataset
+                self.datacube = py4DSTEM.DataCube(
+                    dataset if mmap else preallocate(dataset)
+                )
 
-            R_size, R_units, Q_size, Q_units = find_calibrations(datacubes[0])
+            R_size, R_units, Q_size, Q_units = entry["calibrations"]
 
             self.datacube.calibration.set_R_pixel_size(R_size)
             self.datacube.calibration.set_R_pixel_units(R_units)
             self.datacube.calibration.set_Q_pixel_size(Q_size)
             self.datacube.calibration.set_Q_pixel_units(Q_units)
 
-        else:
+        elif any(len(e["shape"]) == 3 for e in index_hdf5(filepath)):
             # if no 4D data was found, look for 3D data
-            datacubes = get_ND(file, N=3)
-            print(f"Found {len(datacubes)} 3D datasets inside the HDF5 file...")
-            if len(datacubes) >= 1:
-                array = datacubes[0] if mmap else datacubes[0][()]
-                new_shape = ResizeDialog.get_new_size([1, array.shape[0]], parent=self)
-                self.datacube = py4DSTEM.DataCube(
-                    array.reshape(*new_shape, *array.shape[1:])
-                )
-            else:
-                raise ValueError("No 4D (or even 3D) data detected in the H5 file!")
+            entry = choose_hdf5_dataset(self, filepath, N=(3,))
+            if entry is None:
+                return
+
+            dataset = file[entry["name"]]
+            new_shape = ResizeDialog.get_new_size([1, dataset.shape[0]], parent=self)
+            if mmap is None:
+                mode = self.choose_load_mode(dataset.nbytes, dataset.chunks is not None)
+                mmap = mode != "RAM"
+                if mode == "LAZY":
+                    file = h5py.File(filepath, "r", rdcc_nbytes=LAZY_CHUNK_CACHE_BYTES)
+                    dataset = file[entry["name"]]
+            # HDF5 datasets can't be reshaped, so frames are read through a
+            # view that maps scan positions onto them
+            array = ScanFrames(dataset, new_shape)
+            source = None if mmap else array
+            self.datacube = py4DSTEM.DataCube(array if mmap else preallocate(array))
+        else:
+            raise ValueError("No 4D (or even 3D) data detected in the H5 file!")
+    elif extension == ".zarr" or os.path.isdir(filepath):
+        from py4D_browser.zarr_io import open_zarr, find_zarr_calibrations
+
+        array = open_zarr(filepath)
+        if array is None:
+            raise ValueError("No 4D data detected in the Zarr store!")
+        print(f"Reading Zarr array with chunks {array.chunks}")
+        if mmap is None:
+            mmap = self.choose_load_mode(array.size * array.dtype.itemsize) != "RAM"
+        source = None if mmap else array
+        self.datacube = py4DSTEM.DataCube(array if mmap else preallocate(array))
+
+        R_size, R_units, Q_size, Q_units = find_zarr_calibrations(array)
+
+        self.datacube.calibration.set_R_pixel_size(R_size)
+        self.datacube.calibration.set_R_pixel_units(R_units)
+        self.datacube.calibration.set_Q_pixel_size(Q_size)
+        self.datacube.calibration.set_Q_pixel_units(Q_units)
+
+    elif extension == ".mib":
+        from py4D_browser.mib_io import open_mib
+
+        array = open_mib(filepath)
+        print(f"Mapped MIB frames with shape {array.shape}")
+        if mmap is None:
+            mmap = self.choose_load_mode(array.nbytes) != "RAM"
+        source = None if mmap else array
+        self.datacube = py4DSTEM.DataCube(array if mmap else preallocate(array))
+
     elif extension in [".npy"]:
-        self.datacube = py4DSTEM.DataCube(np.load(filepath))
+        array = np.load(filepath, mmap_mode="r")
+        if array.ndim == 5:
+            self.load_time_series(array)
+        else:
+            if mmap is None:
+                mmap = self.choose_load_mode(array.nbytes) != "RAM"
+            source = None if mmap else array
+            self.datacube = py4DSTEM.DataCube(array if mmap else preallocate(array))
+    elif extension == ".npz":
+        entry = choose_npz_array(self, filepath)
+        if entry is None:
+            return
+
+        print(f"Reading array {entry['name']}")
+        array = open_npz_array(filepath, entry)
+        if array.ndim == 3:
+            new_shape = ResizeDialog.get_new_size([1, array.shape[0]], parent=self)
+            array = array.reshape(*new_shape, *array.shape[1:])
+        if array.ndim == 5:
+            self.load_time_series(array)
+        else:
+            if entry["offset"] is None:
+                # deflated members can't be mapped and are already in memory
+                mmap = True
+            elif mmap is None:
+                mmap = self.choose_load_mode(array.nbytes) != "RAM"
+            source = None if mmap else array
+            self.datacube = py4DSTEM.DataCube(array if mmap else preallocate(array))
     else:
+        if mmap is None:
+            # the file size is the best estimate available before reading
+            mmap = self.choose_load_mode(os.path.getsize(filepath)) != "RAM"
         self.datacube = py4DSTEM.import_file(
             filepath,
             mem="MEMMAP" if mmap else "RAM",
@@ -112,6 +441,328 @@ def load_file(self, filepath, mmap=False, binning=1):
 
     self.setWindowTitle(filepath)
 
+    if source is not None:
+        self.fill_progressively(source, filepath)
+
+
+def load_time_series(self, source):
+    """
+    Show the first step of a (T, Rx, Ry, Qx, Qy) time series and the time
+    slider. Steps are loaded as the slider moves, see set_time_step.
+    """
+    budget = get_memory_budget(self)
+    series = TimeSeries(
+        source,
+        cache_bytes=int(budget) if budget is not None else TIME_SERIES_CACHE_BYTES,
+    )
+    print(f"Time series of {len(series)} steps with shape {series.shape[1:]}")
+
+    self.clear_time_series()
+    self.time_series = series
+    self.datacube = py4DSTEM.DataCube(series.get(0))
+    series.current = self.datacube.data
+    series.prefetch(1)
+
+    self.time_slider.blockSignals(True)
+    self.time_slider.setRange(0, len(series) - 1)
+    self.time_slider.setValue(0)
+    self.time_slider.blockSignals(False)
+    self.time_label.setText(f"1/{len(series)}")
+    self.time_bar.show()
+
+
+def set_time_step(self, t):
+    # Swap in another time step, keeping the detectors and calibration
+    series = self.time_series
+    if series is None:
+        return
+    frame = series.get(t)
+    series.current = frame
+    self.datacube.data = frame
+    self.time_label.setText(f"{t + 1}/{len(series)}")
+
+    self.update_diffraction_space_view(reset=False)
+    self.update_real_space_view(reset=False)
+
+    series.prefetch(t + 1)
+
+
+def clear_time_series(self):
+    if self.time_series is not None:
+        self.time_series.close()
+        self.time_series = None
+    self.time_bar.hide()
+
+
+def compute_virtual_image_time_series(self):
+    if self.time_series is None:
+        self.statusBar().showMessage("Load a 5D time series first", 5_000)
+        return
+
+    detector_mode = self.detector_mode_group.checkedAction().text().replace("&", "")
+    if detector_mode not in ("Integrating", "Maximum"):
+        self.statusBar().showMessage(
+            "Time series need the Integrating or Maximum detector response", 5_000
+        )
+        return
+    reduce = masked_sum if detector_mode == "Integrating" else masked_max
+
+    mask = self.get_virtual_detector_mask()
+
+    def show_images(images):
+        self.time_series_window = pg.image(
+            np.transpose(images, (0, 2, 1)), title="Virtual Image Time Series"
+        )
+
+    self.run_in_background(
+        virtual_image_time_series,
+        self.time_series,
+        mask,
+        reduce,
+        on_success=show_images,
+        description="Computing virtual image time series",
+    )
+
+
+def virtual_image_time_series(task, series, mask, reduce):
+    # One pass over the time steps, reading each in blocks of scan rows
+    images = []
+    for t in range(len(series)):
+        task.check_cancelled()
+        images.append(reduce(series.read(t), mask))
+        task.report(f"Virtual image time series: step {t + 1}/{len(series)}")
+    return np.stack(images)
+
+
+def start_live_acquisition(self):
+    """
+    View an acquisition as it is written: frames from a growing file or a
+    socket are copied into a preallocated datacube on a background task,
+    and the virtual image and mean diffraction pattern are updated from the
+    new frames only.
+    """
+    options = LiveAcquisitionDialog.get_options(parent=self)
+    if options is None:
+        return
+    stream = open_live_stream(options)
+
+    shape = (*options["scan_shape"], *stream.frame_shape)
+    try:
+        data = np.zeros(shape, dtype=np.dtype(stream.dtype).newbyteorder("="))
+    except MemoryError:
+        stream.close()
+        raise
+    live = LiveAcquisition(data)
+
+    self.cancel_load()
+    self.datacube = py4DSTEM.DataCube(data)
+    self.update_scalebars()
+    self.update_diffraction_space_view(reset=True)
+    self.update_real_space_view(reset=True)
+    self.setWindowTitle(f"Live: {options['path']}")
+
+    last_refresh = {"time": 0.0}
+
+    def refresh(frames_received):
+        # Views are refreshed at most a few times per second, from the
+        # running reductions when the detector allows it
+        now = time.monotonic()
+        if self.datacube is None or self.datacube.data is not data:
+            return
+        if now - last_refresh["time"] < 0.25:
+            return
+        last_refresh["time"] = now
+
+        detector_mode = self.detector_mode_group.checkedAction().text().replace("&", "")
+        if detector_mode in ("Integrating", "Maximum"):
+            reduce = masked_sum if detector_mode == "Integrating" else masked_max
+            mask = self.get_virtual_detector_mask()
+            if not live.has_detector(mask, reduce):
+                live.set_detector(mask, reduce)
+            self.set_virtual_image(live.virtual_image, reset=False)
+        else:
+            self.update_real_space_view(reset=False)
+
+        self.set_diffraction_image(live.mean_diffraction, reset=False)
+        self.real_space_view_text.setText(
+            f"Live: mean of {frames_received}/{live.frames.shape[0]} patterns"
+        )
+
+    def finished(frames_received):
+        if self.datacube is not None and self.datacube.data is data:
+            self.update_diffraction_space_view(reset=False)
+            self.update_real_space_view(reset=False)
+            self.statusBar().showMessage(
+                f"Live acquisition stopped after {frames_received} patterns", 5_000
+            )
+
+    self.load_task = self.run_in_background(
+        ingest_live,
+        stream,
+        live,
+        on_success=finished,
+        description="Live acquisition",
+    )
+    self.load_task.partial.connect(refresh)
+
+
+def cancel_load(self):
+    # Stop filling or streaming into the current datacube, which is about to
+    # be replaced. Every load calls this before it touches self.datacube.
+    if self.load_task is not None:
+        self.load_task.cancel()
+        self.load_task = None
+    # the preprocessed tcBF state holds on to the datacube
+    self.tcBF_cache = None
+
+
+def choose_load_mode(self, nbytes, chunked=False):
+    """
+    Decide how to hold nbytes of data: "RAM" if it fits in the memory budget
+    (a fraction of the currently available memory), otherwise "MEMMAP" for
+    contiguous data, which the OS pages in as needed, or "LAZY" for chunked
+    data, which is read and decompressed chunk by chunk on demand.
+    """
+    budget = get_memory_budget(self)
+    if budget is None or nbytes <= budget:
+        mode = "RAM"
+    else:
+        mode = "LAZY" if chunked else "MEMMAP"
+    print(f"Data is {nbytes / 2**30:.2f} GB, loading with mode {mode}")
+    return mode
+
+
+def get_memory_budget(self):
+    # Bytes of data we are willing to load into RAM, or None if the available
+    # memory can't be determined
+    if not HAS_PSUTIL:
+        return None
+    fraction = self.settings.value("last_state/memory_budget", 0.5, type=float)
+    return psutil.virtual_memory().available * fraction
+
+
+def set_memory_budget(self):
+    fraction = self.settings.value("last_state/memory_budget", 0.5, type=float)
+    percent, ok = QInputDialog.getInt(
+        self,
+        "Memory Budget",
+        "Load data into RAM if it needs less than this percentage of the\n"
+        "available memory, and memory map it otherwise:",
+        value=int(round(fraction * 100)),
+        min=1,
+        max=100,
+    )
+    if ok:
+        self.settings.setValue("last_state/memory_budget", percent / 100)
+
+
+def load_into_ram(self):
+    assert self.datacube is not None, "No datacube!"
+    data = self.datacube.data
+    if isinstance(data, np.ndarray) and not isinstance(data, np.memmap):
+        self.statusBar().showMessage("Data is already in RAM", 5_000)
+        return
+    if isinstance(data, ElectronEventCube):
+        # the event lists are in RAM, and densifying them could take many
+        # times the memory
+        self.statusBar().showMessage(
+            "Electron events are already in RAM and are kept sparse", 5_000
+        )
+        return
+
+    nbytes = int(np.prod(data.shape)) * np.dtype(data.dtype).itemsize
+    budget = get_memory_budget(self)
+    if budget is not None and nbytes > budget:
+        response = QMessageBox.question(
+            self,
+            "Load into RAM?",
+            f"The data needs {nbytes / 2**30:.1f} GB, more than the memory budget "
+            f"of {budget / 2**30:.1f} GB. Load it into RAM anyway?",
+        )
+        if response != QMessageBox.Yes:
+            return
+
+    # Keep browsing the mapped data until the copy is complete
+    in_ram = preallocate(data)
+
+    def finished(_):
+        if self.datacube is not None and self.datacube.data is data:
+            self.datacube.data = in_ram
+            self.statusBar().showMessage("Data loaded into RAM", 5_000)
+
+    self.run_in_background(
+        get_fill_function(in_ram),
+        data,
+        in_ram,
+        on_success=finished,
+        description="Loading data into RAM",
+    )
+
+
+def preallocate(source):
+    # Compressed HDF5 is decompressed by worker processes, which need the
+    # output in shared memory; without room for it there, it is read here
+    if hdf5_parallel.is_compressed(source) and (os.cpu_count() or 1) > 1:
+        shared = hdf5_parallel.create_shared_array(source.shape, source.dtype)
+        if shared is not None:
+            return shared
+    # zeros are allocated lazily by the OS, so unread rows cost no memory,
+    # and in native byte order so computing on them needs no swapping
+    return np.zeros(source.shape, dtype=np.dtype(source.dtype).newbyteorder("="))
+
+
+def fill_progressively(self, source, filepath):
+    """
+    Copy source into the (preallocated) current datacube in blocks of scan
+    rows on a background task. The views are refreshed as rows arrive, so
+    the loaded part of the data can be browsed while the rest is read.
+    """
+    data = self.datacube.data
+    last_refresh = {"time": 0.0, "cost": 0.0}
+
+    def refresh(rows_loaded):
+        # Skip refreshes for data that has since been replaced, and space
+        # them out so that computing the views never starves the GUI
+        now = time.monotonic()
+        if self.datacube is None or self.datacube.data is not data:
+            return
+        if now - last_refresh["time"] < max(0.5, 4 * last_refresh["cost"]):
+            return
+        self.update_diffraction_space_view(reset=False)
+        self.update_real_space_view(reset=False)
+        last_refresh["time"] = time.monotonic()
+        last_refresh["cost"] = last_refresh["time"] - now
+
+    def finished(_):
+        if self.datacube is not None and self.datacube.data is data:
+            self.update_diffraction_space_view(reset=False)
+            self.update_real_space_view(reset=True)
+            self.statusBar().showMessage(f"Loaded {filepath}", 5_000)
+
+    self.load_task = self.run_in_background(
+        get_fill_function(data),
+        source,
+        data,
+        on_success=finished,
+        description=f"Loading {filepath}",
+    )
+    self.load_task.partial.connect(refresh)
+
+
+def get_fill_function(out):
+    # Arrays in shared memory are filled by worker processes
+    if hdf5_parallel.shared_array_path(out) is not None:
+        return hdf5_parallel.read_parallel
+    return fill_scan_rows
+
+
+def fill_scan_rows(task, source, out):
+    for rows, block in iter_scan_blocks(source):
+        task.check_cancelled()
+        out[rows] = block
+        task.report(f"Loaded {rows.stop}/{out.shape[0]} scan rows")
+        task.publish(rows.stop)
+
 
 def update_scalebars(self):
 
@@ -160,11 +811,35 @@ def reshape_data(self):
     self.update_real_space_view(reset=True)
 
 
+def convert_to_sparse(self):
+    assert self.datacube is not None, "No datacube!"
+    if isinstance(self.datacube.data, ElectronEventCube):
+        self.statusBar().showMessage("Data is already stored as electron events")
+        return
+
+    def on_success(data):
+        self.datacube.data = data
+        self.statusBar().showMessage(
+            f"Stored {data.events.shape[0]} electron events "
+            f"({data.nbytes / 2**20:.1f} MB)"
+        )
+        self.update_diffraction_space_view(reset=True)
+        self.update_real_space_view(reset=True)
+
+    self.run_in_background(
+        lambda task, data: ElectronEventCube.from_dense(data, task),
+        self.datacube.data,
+        on_success=on_success,
+        description="Converting to electron events",
+    )
+
+
 def export_datacube(self, save_format: str):
     assert save_format in [
         "Raw float32",
         "py4DSTEM HDF5",
         "Plain HDF5",
+        "Zarr",
     ], f"unrecognized format {format}"
     assert self.datacube is not None, "No datacube!"
 
@@ -188,16 +863,236 @@ def export_datacube(self, save_format: str):
             return
 
     filename = self.get_savefile_name(save_format)
+    data = self.datacube.data
 
+    if save_format in ("py4DSTEM HDF5", "Plain HDF5"):
+        compression = CompressionDialog.get_options(
+            HDF5_CODECS, data.shape, parent=self
+        )
+        if compression is None:
+            return
+
+    # Every format is written in blocks of scan rows on a worker thread, so
+    # the export never needs more than a block's worth of extra memory
     if save_format == "Raw float32":
-        self.datacube.data.astype(np.float32).tofile(filename)
+        self.run_in_background(
+            write_raw_float32, data, filename, description=f"Exporting {filename}"
+        )
 
     elif save_format == "py4DSTEM HDF5":
-        py4DSTEM.save(filename, self.datacube, mode="o")
+        # py4DSTEM writes the tree, metadata and calibrations around a
+        # placeholder array, whose dataset is then replaced by the real data
+        data_path = write_py4DSTEM_placeholder(self.datacube, filename)
+        self.run_in_background(
+            write_hdf5_array,
+            data,
+            filename,
+            data_path,
+            "r+",
+            compression,
+            description=f"Exporting {filename}",
+        )
 
     elif save_format == "Plain HDF5":
-        with h5py.File(filename, "w") as f:
-            f["array"] = self.datacube.data
+        self.run_in_background(
+            write_hdf5_array,
+            data,
+            filename,
+            "array",
+            "w",
+            compression,
+            description=f"Exporting {filename}",
+        )
+
+    elif save_format == "Zarr":
+        from py4D_browser.zarr_io import write_zarr_array
+
+        calibrations = (
+            self.datacube.calibration.get_R_pixel_size(),
+            self.datacube.calibration.get_R_pixel_units(),
+            self.datacube.calibration.get_Q_pixel_size(),
+            self.datacube.calibration.get_Q_pixel_units(),
+        )
+        self.run_in_background(
+            write_zarr_array,
+            data,
+            filename,
+            calibrations,
+            description=f"Exporting {filename}",
+        )
+
+
+def write_raw_float32(task, data, filename):
+    try:
+        with open(filename, "wb") as f:
+            for rows, block in iter_scan_blocks(data):
+                task.check_cancelled()
+                block.astype(np.float32).tofile(f)
+                task.report(f"Writing {filename}: row {rows.stop}/{data.shape[0]}")
+    except TaskCancelled:
+        os.remove(filename)
+        raise
+
+
+def write_py4DSTEM_placeholder(datacube, filename) -> str:
+    """
+    Save datacube with py4DSTEM, but with a single element standing in for
+    its data, and return the location of that placeholder dataset. The dim
+    vectors are computed before the swap, so they still match the real data.
+    """
+    data = datacube.data
+    try:
+        datacube.data = np.zeros((1,) * data.ndim, dtype=data.dtype)
+        py4DSTEM.save(filename, datacube, mode="o")
+    finally:
+        datacube.data = data
+
+    data_paths = []
+    with h5py.File(filename, "r") as f:
+        f.visititems(
+            lambda name, obj: (
+                data_paths.append(name)
+                if isinstance(obj, h5py.Dataset)
+                and obj.parent.attrs.get("python_class") == "DataCube"
+                and name.endswith("/data")
+                else None
+            )
+        )
+    return data_paths[0]
+
+
+def write_hdf5_array(
+    task, data, filename, data_path="array", mode="w", compression=None
+):
+    """
+    Write data to the dataset at data_path in filename, one block of scan rows
+    at a time. compression holds the codec, level and chunk shape from
+    CompressionDialog; by default the data is uncompressed and chunked by
+    diffraction pattern. An existing dataset at that location is replaced,
+    keeping its attributes. Runs in a BackgroundTask and removes the partial
+    file if the task is cancelled.
+
+    When the codec can be run from Python, chunks are compressed by a pool of
+    threads and written directly, in order; otherwise HDF5 compresses them
+    as they are written.
+    """
+    compression = compression or {"codec": "None", "level": 0, "chunks": None}
+    chunks = compression["chunks"] or (1, 1, *data.shape[2:])
+    encoder = get_chunk_encoder(
+        compression["codec"], compression["level"], data.dtype.itemsize
+    )
+
+    try:
+        with h5py.File(filename, mode) as f, ThreadPoolExecutor() as pool:
+            attrs = {}
+            if data_path in f:
+                attrs = dict(f[data_path].attrs)
+                del f[data_path]
+            dset = f.create_dataset(
+                data_path,
+                shape=data.shape,
+                dtype=data.dtype,
+                chunks=chunks,
+                **get_hdf5_filter(compression["codec"], compression["level"]),
+            )
+            dset.attrs.update(attrs)
+            for rows, block in iter_scan_blocks(data, row_multiple=chunks[0]):
+                task.check_cancelled()
+                if encoder is None:
+                    dset[rows] = block
+                else:
+                    offsets = list(
+                        itertools.product(
+                            *(range(0, n, c) for n, c in zip(block.shape, chunks))
+                        )
+                    )
+                    encoded = pool.map(
+                        partial(encode_chunk, block, chunks, encoder), offsets
+                    )
+                    for offset, chunk in zip(offsets, encoded):
+                        dset.id.write_direct_chunk(
+                            (offset[0] + rows.start, *offset[1:]), chunk
+                        )
+                task.report(f"Writing {filename}: row {rows.stop}/{data.shape[0]}")
+    except TaskCancelled:
+        os.remove(filename)
+        raise
+
+
+# Compression codecs offered for HDF5 exports, mapped to their (default level,
+# max level), or None if the codec has no level setting
+HDF5_CODECS = {
+    "None": None,
+    "gzip": (4, 9),
+    "LZF": None,
+}
+if HAS_HDF5PLUGIN:
+    HDF5_CODECS.update(
+        {
+            "Blosc (LZ4)": (5, 9),
+            "Blosc (Zstd)": (5, 9),
+            "Zstd": (3, 22),
+            "LZ4": None,
+            "Bitshuffle (LZ4)": None,
+        }
+    )
+
+
+def get_hdf5_filter(codec: str, level: int) -> dict:
+    # h5py create_dataset arguments for a codec from HDF5_CODECS
+    match codec:
+        case "None":
+            return {}
+        case "gzip":
+            return {"compression": "gzip", "compression_opts": level}
+        case "LZF":
+            return {"compression": "lzf"}
+        case "Blosc (LZ4)" | "Blosc (Zstd)":
+            return dict(
+                hdf5plugin.Blosc(
+                    cname="lz4" if codec == "Blosc (LZ4)" else "zstd",
+                    clevel=level,
+                    shuffle=hdf5plugin.Blosc.SHUFFLE,
+                )
+            )
+        case "Zstd":
+            return dict(hdf5plugin.Zstd(clevel=level))
+        case "LZ4":
+            return dict(hdf5plugin.LZ4())
+        case "Bitshuffle (LZ4)":
+            return dict(hdf5plugin.Bitshuffle(cname="lz4"))
+        case unknown:
+            raise ValueError(f"Unknown compression: {unknown}")
+
+
+def get_chunk_encoder(codec: str, level: int, itemsize: int):
+    """
+    A function compressing the bytes of one chunk exactly as the HDF5 filter
+    for codec would, for the codecs that have a Python implementation
+    available that releases the GIL. Returns None for all other codecs.
+    """
+    if codec == "gzip":
+        return partial(zlib.compress, level=level)
+    if codec in ("Blosc (LZ4)", "Blosc (Zstd)") and HAS_BLOSC:
+        return partial(
+            blosc.compress,
+            typesize=itemsize,
+            clevel=level,
+            shuffle=blosc.SHUFFLE,
+            cname="lz4" if codec == "Blosc (LZ4)" else "zstd",
+        )
+    if codec == "Zstd" and HAS_ZSTANDARD:
+        return partial(zstandard.compress, level=level)
+    return None
+
+
+def encode_chunk(block, chunks, encoder, offset):
+    # Compress the chunk of block starting at offset. HDF5 always stores
+    # whole chunks, so chunks hanging over the edge are padded with zeros.
+    chunk = block[tuple(slice(o, o + c) for o, c in zip(offset, chunks))]
+    if chunk.shape != chunks:
+        chunk = np.pad(chunk, [(0, c - n) for c, n in zip(chunks, chunk.shape)])
+    return encoder(np.ascontiguousarray(chunk).tobytes())
 
 
 def export_virtual_image(self, im_format: str, im_type: str):
@@ -240,6 +1135,10 @@ def show_keyboard_map(self):
 
 
 def reconstruct_tcBF_auto(self):
+    if self.tcBF_task is not None and not self.tcBF_task.is_settled():
+        self.statusBar().showMessage("tcBF reconstruction is already running", 5_000)
+        return
+
     # tcBF requires an area detector for generating the mask
     detector_shape = self.detector_shape_group.checkedAction().text().replace("&", "")
     if detector_shape not in [
@@ -250,8 +1149,8 @@ def reconstruct_tcBF_auto(self):
         return
 
     if (
-        self.datacube.calibration.get_R_pixel_units == "pixels"
-        or self.datacube.calibration.get_Q_pixel_units == "pixels"
+        self.datacube.calibration.get_R_pixel_units() == "pixels"
+        or self.datacube.calibration.get_Q_pixel_units() == "pixels"
     ):
         self.statusBar().showMessage("tcBF requires caibrated data", 5_000)
         return
@@ -278,26 +1177,101 @@ def reconstruct_tcBF_auto(self):
     else:
         raise ValueError("idk how we got here...")
 
-    # do tcBF!
-    self.statusBar().showMessage("Reconstructing... (This may take a while)")
-    self.app.processEvents()
+    energy = self.settings.value("last_state/beam_energy", 300.0, type=float)
+    parameters = AutoTCBFDialog.get_parameters(parent=self, energy=energy)
+    if parameters is None:
+        return
+    energy = parameters.pop("energy")
+    self.settings.setValue("last_state/beam_energy", energy)
 
-    tcBF = py4DSTEM.process.phase.Parallax(
-        energy=300e3,
-        datacube=self.datacube,
-    )
-    tcBF.preprocess(
-        dp_mask=mask,
-        plot_average_bf=False,
-        vectorized_com_calculation=False,
-        store_initial_arrays=False,
+    # Preprocessing is by far the slowest step, so the preprocessed state is
+    # kept for as long as the dataset, mask, and energy stay the same
+    # (it is cleared by cancel_load when the dataset is replaced)
+    cache = self.tcBF_cache
+    if (
+        cache is None
+        or cache["datacube"]() is not self.datacube
+        or cache["energy"] != energy
+        or not np.array_equal(cache["mask"], mask)
+    ):
+        cache = None
+        self.tcBF_cache = None
+    datacube = weakref.ref(self.datacube)
+
+    def show_result(result):
+        if self.datacube is not datacube():
+            self.statusBar().showMessage(
+                "tcBF result discarded, the dataset was replaced", 5_000
+            )
+            return
+        preprocessed, parallax = result
+        self.tcBF_cache = {
+            "datacube": datacube,
+            "mask": mask,
+            "energy": energy,
+            "parallax": preprocessed,
+        }
+        self.set_virtual_image(parallax.recon_BF, reset=True)
+        self.statusBar().showMessage("tcBF reconstruction done", 5_000)
+
+    # Only one run at a time, including one that was cancelled but is still
+    # running detached
+    self.tcBF_action_auto.setEnabled(False)
+    self.tcBF_task = self.run_in_background(
+        run_tcBF_auto,
+        self.datacube,
+        mask,
+        energy,
+        cache["parallax"] if cache is not None else None,
+        parameters,
+        on_success=show_result,
+        description="tcBF reconstruction",
     )
-    tcBF.reconstruct(
-        plot_aligned_bf=False,
-        plot_convergence=False,
+    self.tcBF_task.settled.connect(lambda: self.tcBF_action_auto.setEnabled(True))
+    if self.tcBF_task.is_settled():
+        # it settled before the connection was made
+        self.tcBF_action_auto.setEnabled(True)
+
+
+def run_tcBF_auto(task, datacube, mask, energy, preprocessed, parameters):
+    """
+    Runs on a worker thread, see reconstruct_tcBF_auto. The py4DSTEM calls
+    can't be interrupted, so they run detached and a cancelled run returns
+    at once. Each run reconstructs on its own copy of the preprocessed
+    state, which reconstruct(reset=True) starts from without modifying it.
+    Returns the preprocessed state, for caching, and the reconstruction.
+    """
+    if preprocessed is None:
+        task.report("Preprocessing tcBF... (This may take a while)")
+        preprocessed = py4DSTEM.process.phase.Parallax(
+            energy=energy * 1e3,
+            datacube=datacube,
+            verbose=False,
+        )
+        task.run_detached(
+            partial(
+                preprocessed.preprocess,
+                dp_mask=mask,
+                plot_average_bf=False,
+                vectorized_com_calculation=False,
+                store_initial_arrays=True,
+            )
+        )
+    task.check_cancelled()
+
+    task.report("Aligning tcBF images...")
+    parallax = copy.copy(preprocessed)
+    task.run_detached(
+        partial(
+            parallax.reconstruct,
+            reset=True,
+            plot_aligned_bf=False,
+            plot_convergence=False,
+            progress_bar=False,
+            **parameters,
+        )
     )
-
-    self.set_virtual_image(tcBF.recon_BF, reset=True)
+    return preprocessed, parallax
 
 
 def reconstruct_tcBF_manual(self):
@@ -337,6 +1311,7 @@ def get_savefile_name(self, file_format) -> str:
         "Raw float32": "RAW File (*.raw *.f32);;Any file (*)",
         "py4DSTEM HDF5": "HDF5 File (*.hdf5 *.h5 *.emd *.py4dstem);;Any file (*)",
         "Plain HDF5": "HDF5 File (*.hdf5 *.h5;;Any file (*)",
+        "Zarr": "Zarr Store (*.zarr);;Any file (*)",
         "PNG (display)": "PNG File (*.png);;Any file (*)",
         "TIFF (display)": "TIFF File (*.tiff *.tif *.tff);;Any File (*)",
         "TIFF (raw)": "TIFF File (*.tiff *.tif *.tff);;Any File (*)",
@@ -346,6 +1321,7 @@ def get_savefile_name(self, file_format) -> str:
         "Raw float32": ".raw",
         "py4DSTEM HDF5": ".h5",
         "Plain HDF5": ".h5",
+        "Zarr": ".zarr",
         "PNG (display)": ".png",
         "TIFF (display)": ".tiff",
         "TIFF (raw)": ".tiff",
@@ -375,19 +1351,74 @@ def get_savefile_name(self, file_format) -> str:
 
 
 def get_ND(f, datacubes=None, N=4):
-    # Traverse an h5py.File and look for Datasets with N dimensions
+    # Traverse an h5py.File and look for Datasets with N dimensions, or any
+    # of the numbers of dimensions in N if it is a tuple
     if datacubes is None:
         datacubes = []
-    for k in f.keys():
-        if isinstance(f[k], h5py.Dataset):
-            # we found data
-            if len(f[k].shape) == N:
-                datacubes.append(f[k])
-        elif isinstance(f[k], h5py.Group):
-            get_ND(f[k], datacubes)
+    N = N if isinstance(N, tuple) else (N,)
+
+    def visit(name, obj):
+        if isinstance(obj, h5py.Dataset) and len(obj.shape) in N:
+            datacubes.append(obj)
+
+    # visititems walks the whole file in a single pass inside HDF5
+    f.visititems(visit)
     return datacubes
 
 
+def index_hdf5(filepath):
+    """
+    Describe the 3D to 5D datasets in an HDF5 file: a tuple of dicts with
+    the dataset name, shape, dtype, chunks and calibrations, those with the
+    most dimensions first and then the largest. Results are cached for as
+    long as the file is unchanged.
+    """
+    stat = os.stat(filepath)
+    return _index_hdf5(os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=32)
+def _index_hdf5(filepath, mtime, size):
+    with h5py.File(filepath, "r") as file:
+        datasets = get_ND(file, N=(3, 4, 5))
+        entries = tuple(
+            {
+                "name": dset.name,
+                "shape": dset.shape,
+                "dtype": dset.dtype,
+                "chunks": dset.chunks,
+                "calibrations": find_calibrations(dset),
+            }
+            for dset in datasets
+        )
+    return tuple(
+        sorted(entries, key=lambda e: (-len(e["shape"]), -np.prod(e["shape"])))
+    )
+
+
+def choose_hdf5_dataset(parent, filepath, N=(4,)):
+    # The index entry to load from filepath, asking the user (if there is a
+    # parent window) when there are several datasets with a number of
+    # dimensions in N. None if there are none or the user cancels.
+    entries = [e for e in index_hdf5(filepath) if len(e["shape"]) in N]
+    dims = "/".join(str(n) for n in N)
+    print(f"Found {len(entries)} {dims}D datasets inside the HDF5 file...")
+    if len(entries) <= 1 or parent is None:
+        return entries[0] if entries else None
+    return DatasetPickerDialog.get_dataset(entries, parent=parent)
+
+
+def choose_npz_array(parent, filepath):
+    # Like choose_hdf5_dataset, for the 3D to 5D arrays in an .npz archive
+    entries = [e for e in index_npz(filepath) if len(e["shape"]) in (3, 4, 5)]
+    print(f"Found {len(entries)} 3D/4D/5D arrays inside the NPZ file...")
+    if len(entries) == 0:
+        raise ValueError("No 4D (or even 3D) data detected in the NPZ file!")
+    if len(entries) == 1 or parent is None:
+        return entries[0]
+    return DatasetPickerDialog.get_dataset(entries, parent=parent)
+
+
 def find_calibrations(dset: h5py.Dataset):
     # Attempt to find calibrations from an H5 file
     R_size, R_units, Q_size, Q_units = 1.0, "pixels", 1.0, "pixels"
@@ -0,0 +1,71 @@
+import numpy as np
+import os
+
+from py4D_browser.utils import memmap_frames
+
+# Pixel depths of non-raw frames; MIB data is always big-endian
+MIB_DTYPES = {"U08": ">u1", "U16": ">u2", "U32": ">u4"}
+
+
+def read_mib_header(filepath):
+    """
+    Parse the ASCII header at the start of a Merlin MIB file. Every frame has
+    a header of the same length, so the first one describes the whole file.
+    """
+    with open(filepath, "rb") as f:
+        start = f.read(1024)
+    fields = start.split(b",")
+    header_bytes = int(fields[2])
+    fields = start[:header_bytes].decode("ascii", errors="replace").split(",")
+    return {
+        "header_bytes": header_bytes,
+        "n_chips": int(fields[3]),
+        "width": int(fields[4]),
+        "height": int(fields[5]),
+        "pixel_depth": fields[6],
+        "layout": fields[7].strip(),
+    }
+
+
+def find_mib_scan_shape(filepath, n_frames):
+    # The .hdr file written alongside the MIB holds the scan size; failing
+    # that, assume a square scan
+    hdr_path = os.path.splitext(filepath)[0] + ".hdr"
+    if os.path.exists(hdr_path):
+        values = {}
+        with open(hdr_path, encoding="UTF-8", errors="replace") as f:
+            for line in f:
+                key, _, value = line.partition("\t")
+                values[key.rstrip(":").strip()] = value.strip()
+        if "ScanX" in values and "ScanY" in values:
+            shape = (int(values["ScanY"]), int(values["ScanX"]))
+            if shape[0] * shape[1] <= n_frames:
+                return shape
+    N = int(np.round(np.sqrt(n_frames)))
+    return (N, N) if N * N == n_frames else (1, n_frames)
+
+
+def open_mib(filepath):
+    """
+    Map a MIB file as a (Rx, Ry, Qx, Qy) array without reading it. The frame
+    stride comes from the first header, and the view steps over every frame
+    header, so nothing is parsed per frame. Single-chip and quad (2x2,
+    including the gapped 2x2G) layouts are handled through the frame size in
+    the header; 1, 6, 12 and 24 bit counters are stored as U08, U08, U16 and
+    U32 frames.
+    """
+    header = read_mib_header(filepath)
+    if header["pixel_depth"] not in MIB_DTYPES:
+        raise ValueError(
+            f"MIB frames of type {header['pixel_depth']} (raw mode) are not supported"
+        )
+
+    frames = memmap_frames(
+        filepath,
+        MIB_DTYPES[header["pixel_depth"]],
+        (header["height"], header["width"]),
+        frame_header=header["header_bytes"],
+    )
+    scan_shape = find_mib_scan_shape(filepath, frames.shape[0])
+    n_frames = scan_shape[0] * scan_shape[1]
+    return frames[:n_frames].reshape(*scan_shape, *frames.shape[1:])
@@ -0,0 +1,80 @@
+import numpy as np
+import struct
+import zipfile
+
+# Fixed part of a zip local file header, before the file name and extra field
+LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+
+
+def index_npz(filepath):
+    """
+    Describe the arrays in an .npz archive without reading them. For members
+    stored without compression, offset is where the .npy data starts in the
+    archive, so the array can be mapped in place; deflated members have
+    offset None.
+    """
+    entries = []
+    with zipfile.ZipFile(filepath) as archive, open(filepath, "rb") as f:
+        for info in archive.infolist():
+            if not info.filename.endswith(".npy"):
+                continue
+            with archive.open(info) as member:
+                version = np.lib.format.read_magic(member)
+                shape, fortran_order, dtype = read_npy_header(member, version)
+                header_bytes = member.tell()
+            if dtype.hasobject:
+                continue
+
+            offset = None
+            if info.compress_type == zipfile.ZIP_STORED:
+                # the local header can carry a different extra field from the
+                # central directory, so read its lengths from the file
+                f.seek(info.header_offset)
+                fields = LOCAL_HEADER.unpack(f.read(LOCAL_HEADER.size))
+                assert fields[0] == LOCAL_HEADER_SIGNATURE, "Bad zip local header"
+                name_length, extra_length = fields[-2:]
+                offset = (
+                    info.header_offset
+                    + LOCAL_HEADER.size
+                    + name_length
+                    + extra_length
+                    + header_bytes
+                )
+
+            entries.append(
+                {
+                    "name": info.filename[: -len(".npy")],
+                    "shape": shape,
+                    "dtype": dtype,
+                    "chunks": None if offset is not None else "deflated",
+                    "offset": offset,
+                    "fortran_order": fortran_order,
+                }
+            )
+    return entries
+
+
+def read_npy_header(fp, version):
+    if version == (1, 0):
+        return np.lib.format.read_array_header_1_0(fp)
+    return np.lib.format.read_array_header_2_0(fp)
+
+
+def open_npz_array(filepath, entry):
+    """
+    Memory map a stored member of an .npz archive, as described by its
+    index_npz entry. Deflated members cannot be mapped and are decompressed
+    into memory instead.
+    """
+    if entry["offset"] is None:
+        with np.load(filepath) as archive:
+            return archive[entry["name"]]
+    return np.memmap(
+        filepath,
+        dtype=entry["dtype"],
+        mode="r",
+        offset=entry["offset"],
+        shape=entry["shape"],
+        order="F" if entry["fortran_order"] else "C",
+    )
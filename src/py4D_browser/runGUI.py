@@ -4,6 +4,9 @@ import py4D_browser
 import sys
 from PyQt5.QtWidgets import QApplication
 
+# Viewers opened by show(), most recent last
+_viewers = []
+
 
 def launch():
     app = QApplication(sys.argv)
@@ -12,5 +15,60 @@ def launch():
     sys.exit(app.exec_())
 
 
+def show(
+    data,
+    R_pixel_size=None,
+    R_pixel_units=None,
+    Q_pixel_size=None,
+    Q_pixel_units=None,
+    title="Array",
+    new_window=False,
+    block=None,
+):
+    """
+    Open a 4D array (ndarray, memory map, h5py Dataset, ...) or a py4DSTEM
+    DataCube in the viewer, without copying it. The most recent viewer
+    opened by show() is reused unless it was closed or new_window is set.
+
+    In IPython or Jupyter, run `%gui qt` first so that the window runs
+    alongside the session. From a script, show() blocks until the window is
+    closed unless block=False. Returns the DataViewer.
+    """
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+
+    viewers = [v for v in _viewers if v.isVisible()]
+    if viewers and not new_window:
+        viewer = viewers[-1]
+    else:
+        viewer = py4D_browser.DataViewer([])
+        viewers.append(viewer)
+    _viewers[:] = viewers
+
+    viewer.load_array(
+        data,
+        R_pixel_size=R_pixel_size,
+        R_pixel_units=R_pixel_units,
+        Q_pixel_size=Q_pixel_size,
+        Q_pixel_units=Q_pixel_units,
+        title=title,
+    )
+    viewer.raise_()
+
+    if block is None:
+        block = not is_interactive()
+    if block:
+        app.exec_()
+    return viewer
+
+
+def is_interactive():
+    # An interactive interpreter or IPython session, which can keep running
+    # while the window is open
+    if hasattr(sys, "ps1") or sys.flags.interactive:
+        return True
+    IPython = sys.modules.get("IPython")
+    return IPython is not None and IPython.get_ipython() is not None
+
+
 if __name__ == "__main__":
     launch()
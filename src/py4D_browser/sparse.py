@@ -0,0 +1,224 @@
+import numpy as np
+import h5py
+
+from py4D_browser.utils import iter_scan_blocks
+
+
+class ElectronEventCube:
+    """
+    Sparse 4D-STEM datacube for counting detectors. Each scan position holds
+    the flattened detector indices of its counted electrons: the events for
+    frame f are events[offsets[f]:offsets[f+1]]. Indexing returns dense count
+    arrays, so the object can stand in for a dense array, while the reductions
+    used by the viewer work on the event lists directly.
+    """
+
+    def __init__(self, events, offsets, scan_shape, frame_shape, dtype=np.uint16):
+        self.events = np.asarray(events, dtype=np.uint32)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.scan_shape = tuple(int(s) for s in scan_shape)
+        self.frame_shape = tuple(int(s) for s in frame_shape)
+        self.dtype = np.dtype(dtype)
+        self._event_frames = None
+
+        assert self.offsets.shape == (np.prod(self.scan_shape) + 1,)
+        assert self.offsets[-1] == self.events.shape[0]
+
+    @classmethod
+    def from_dense(cls, data, task=None):
+        """
+        Build the event lists from a dense counted datacube, reading it in
+        blocks of scan rows so that it never needs to fit in memory.
+        """
+        Rx, Ry, Qx, Qy = data.shape
+        events = []
+        counts = []
+        for _, block in iter_scan_blocks(data):
+            if task is not None:
+                task.check_cancelled()
+            frames = block.reshape(-1, Qx * Qy)
+            if np.issubdtype(frames.dtype, np.floating):
+                frames = np.rint(frames)
+            frames = np.maximum(frames, 0).astype(np.int64)
+            # frames with several electrons on one pixel repeat that index
+            frame_idx, pixel_idx = np.nonzero(frames)
+            multiplicity = frames[frame_idx, pixel_idx]
+            events.append(np.repeat(pixel_idx, multiplicity).astype(np.uint32))
+            counts.append(frames.sum(axis=1))
+        offsets = np.zeros(Rx * Ry + 1, dtype=np.int64)
+        np.cumsum(np.concatenate(counts), out=offsets[1:])
+        return cls(np.concatenate(events), offsets, (Rx, Ry), (Qx, Qy))
+
+    @property
+    def shape(self):
+        return self.scan_shape + self.frame_shape
+
+    @property
+    def ndim(self):
+        return 4
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def nbytes(self):
+        return self.events.nbytes + self.offsets.nbytes
+
+    def __len__(self):
+        return self.scan_shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        return self[...] if dtype is None else self[...].astype(dtype)
+
+    def reshape(self, *shape):
+        # Only the scan is reshaped; events are stored in raster order
+        assert tuple(shape[2:]) == self.frame_shape, "Cannot reshape the detector"
+        return ElectronEventCube(
+            self.events, self.offsets, shape[:2], self.frame_shape, self.dtype
+        )
+
+    @property
+    def event_frames(self):
+        """Scan position (flat index) of every event, computed on first use"""
+        if self._event_frames is None:
+            counts = np.diff(self.offsets)
+            self._event_frames = np.repeat(
+                np.arange(counts.shape[0], dtype=np.uint32), counts
+            )
+        return self._event_frames
+
+    def _frame_events(self, frames):
+        """Gather the events of the given flat scan positions"""
+        starts = self.offsets[frames]
+        counts = self.offsets[frames + 1] - starts
+        ends = np.cumsum(counts)
+        owner = np.repeat(np.arange(frames.shape[0]), counts)
+        index = np.arange(ends[-1] if ends.shape[0] else 0) + np.repeat(
+            starts - (ends - counts), counts
+        )
+        return owner, self.events[index]
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            i = key.index(Ellipsis)
+            key = key[:i] + (slice(None),) * (5 - len(key)) + key[i + 1 :]
+        key = key + (slice(None),) * (4 - len(key))
+
+        axes = [np.arange(n)[k] for n, k in zip(self.shape, key)]
+        out_shape = [a.shape[0] for a in axes if a.ndim == 1]
+        rx, ry, qx, qy = (np.atleast_1d(a) for a in axes)
+
+        # Map each detector pixel to its position in the output frame
+        pixel_map = np.full(self.frame_shape, -1, dtype=np.int64)
+        pixel_map[np.ix_(qx, qy)] = np.arange(qx.shape[0] * qy.shape[0]).reshape(
+            qx.shape[0], qy.shape[0]
+        )
+
+        frames = (rx[:, None] * self.scan_shape[1] + ry[None, :]).ravel()
+        owner, events = self._frame_events(frames)
+        out_pixel = pixel_map.ravel()[events]
+        keep = out_pixel >= 0
+
+        n_out = qx.shape[0] * qy.shape[0]
+        dense = np.bincount(
+            owner[keep] * n_out + out_pixel[keep],
+            minlength=frames.shape[0] * n_out,
+        )
+        return dense.astype(self.dtype).reshape(out_shape)
+
+    def virtual_image(self, mask):
+        """Sum of the (possibly weighted) mask over each frame's events"""
+        weights = np.asarray(mask, dtype=np.float64).ravel()[self.events]
+        return np.bincount(
+            self.event_frames, weights=weights, minlength=self.offsets.shape[0] - 1
+        ).reshape(self.scan_shape)
+
+    def virtual_image_max(self, mask):
+        """Maximum of the masked counts in each frame"""
+        inside = np.asarray(mask, dtype=bool).ravel()[self.events]
+        n_pixels = np.prod(self.frame_shape)
+        keys, counts = np.unique(
+            self.event_frames[inside].astype(np.int64) * n_pixels + self.events[inside],
+            return_counts=True,
+        )
+        vimg = np.zeros(self.offsets.shape[0] - 1)
+        np.maximum.at(vimg, keys // n_pixels, counts)
+        return vimg.reshape(self.scan_shape)
+
+    def center_of_mass(self, mask):
+        """Center of mass of the masked events in each frame, in pixels"""
+        weights = np.asarray(mask, dtype=np.float64).ravel()[self.events]
+        qx, qy = np.divmod(self.events, self.frame_shape[1])
+        n_frames = self.offsets.shape[0] - 1
+        total = np.bincount(self.event_frames, weights=weights, minlength=n_frames)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            CoMx = (
+                np.bincount(self.event_frames, weights=weights * qx, minlength=n_frames)
+                / total
+            )
+            CoMy = (
+                np.bincount(self.event_frames, weights=weights * qy, minlength=n_frames)
+                / total
+            )
+        return CoMx.reshape(self.scan_shape), CoMy.reshape(self.scan_shape)
+
+    def diffraction_sum(self, slice_x, slice_y):
+        """Summed diffraction pattern over a rectangle of scan positions"""
+        rx = np.arange(self.scan_shape[0])[slice_x]
+        ry = np.arange(self.scan_shape[1])[slice_y]
+        frames = (rx[:, None] * self.scan_shape[1] + ry[None, :]).ravel()
+        _, events = self._frame_events(frames)
+        return np.bincount(events, minlength=np.prod(self.frame_shape)).reshape(
+            self.frame_shape
+        )
+
+    def diffraction_max(self, slice_x, slice_y):
+        """Per-pixel maximum count over a rectangle of scan positions"""
+        rx = np.arange(self.scan_shape[0])[slice_x]
+        ry = np.arange(self.scan_shape[1])[slice_y]
+        frames = (rx[:, None] * self.scan_shape[1] + ry[None, :]).ravel()
+        owner, events = self._frame_events(frames)
+        n_pixels = np.prod(self.frame_shape)
+        keys, counts = np.unique(
+            owner.astype(np.int64) * n_pixels + events, return_counts=True
+        )
+        DP = np.zeros(n_pixels, dtype=np.int64)
+        np.maximum.at(DP, keys % n_pixels, counts)
+        return DP.reshape(self.frame_shape)
+
+
+def find_electron_events(file):
+    """
+    Find electron-event lists in an open HDF5 file, in the layout written by
+    stempy's save_electron_counts. Returns None if the file holds none.
+    """
+    group = file.get("electron_events")
+    if not isinstance(group, h5py.Group) or "frames" not in group:
+        return None
+    return group
+
+
+def read_electron_events(group):
+    frames = group["frames"]
+    scan_positions = group["scan_positions"]
+
+    # Events are stored per frame in acquisition order, with scan_positions
+    # giving where each frame belongs in the raster
+    scan_shape = (int(scan_positions.attrs["Ny"]), int(scan_positions.attrs["Nx"]))
+    frame_shape = (int(frames.attrs["Ny"]), int(frames.attrs["Nx"]))
+
+    frame_events = frames[()]
+    positions = scan_positions[()]
+    counts = np.zeros(np.prod(scan_shape), dtype=np.int64)
+    counts[positions] = [f.shape[0] for f in frame_events]
+    offsets = np.zeros(counts.shape[0] + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    events = np.empty(offsets[-1], dtype=np.uint32)
+    for position, f in zip(positions, frame_events):
+        events[offsets[position] : offsets[position + 1]] = f
+
+    return ElectronEventCube(events, offsets, scan_shape, frame_shape)
@@ -0,0 +1,112 @@
+import numpy as np
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TimeSeries:
+    """
+    A (T, Rx, Ry, Qx, Qy) time series of 4D scans, handed out one time step
+    at a time. Arrays in memory or memory mapped are sliced in place; other
+    sources (such as HDF5 datasets) read whole steps into an LRU cache of at
+    most cache_bytes, with the next step prefetched on a background thread.
+    Steps too large for the cache are read lazily through a FrameView.
+    """
+
+    def __init__(self, source, cache_bytes=2 * 2**30):
+        assert len(source.shape) == 5, "Time series need 5D data"
+        self.source = source
+        self.shape = tuple(source.shape)
+        self.dtype = np.dtype(source.dtype)
+
+        self.frame_nbytes = int(np.prod(self.shape[1:])) * self.dtype.itemsize
+        self.cached = not isinstance(source, np.ndarray) and (
+            self.frame_nbytes <= cache_bytes
+        )
+        self.cache_frames = max(1, cache_bytes // self.frame_nbytes)
+        self.cache = OrderedDict()
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(1)
+
+        # The step being shown, so that the viewer can tell if it was replaced
+        self.current = None
+
+    def __len__(self):
+        return self.shape[0]
+
+    def read(self, t):
+        # One time step, without touching the cache
+        if isinstance(self.source, np.ndarray):
+            return self.source[t]
+        if not self.cached:
+            return FrameView(self.source, t)
+        return np.asarray(self.source[t])
+
+    def get(self, t):
+        if not self.cached:
+            return self.read(t)
+
+        with self.lock:
+            if t in self.cache:
+                self.cache.move_to_end(t)
+                return self.cache[t]
+            future = self.pending.get(t)
+        frame = future.result() if future is not None else self.read(t)
+        self.store(t, frame)
+        return frame
+
+    def prefetch(self, t):
+        if not self.cached or not 0 <= t < len(self):
+            return
+        with self.lock:
+            if t in self.cache or t in self.pending:
+                return
+            self.pending[t] = self.pool.submit(self.read, t)
+            self.pending[t].add_done_callback(
+                lambda future: self.store(t, future.result())
+            )
+
+    def store(self, t, frame):
+        with self.lock:
+            self.pending.pop(t, None)
+            self.cache[t] = frame
+            while len(self.cache) > self.cache_frames:
+                self.cache.popitem(last=False)
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class FrameView:
+    """
+    Lazy 4D view of one time step of a 5D array-like: indexing it reads only
+    the requested part of that step.
+    """
+
+    def __init__(self, source, t):
+        self.source = source
+        self.t = t
+        self.shape = tuple(source.shape[1:])
+        self.dtype = np.dtype(source.dtype)
+
+    @property
+    def ndim(self):
+        return 4
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self[...], dtype=dtype)
+
+    def __getitem__(self, key):
+        key = key if isinstance(key, tuple) else (key,)
+        if any(k is Ellipsis for k in key):
+            i = key.index(Ellipsis)
+            key = key[:i] + (slice(None),) * (5 - len(key)) + key[i + 1 :]
+        return np.asarray(self.source[(self.t, *key)])
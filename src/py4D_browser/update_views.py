@@ -11,8 +11,12 @@ from py4D_browser.utils import (
     pg_point_roi,
     make_detector,
     complex_to_Lab,
-    StatusBarWriter,
+    accumulator_dtype,
+    masked_sum,
+    masked_max,
+    masked_center_of_mass,
 )
+from py4D_browser.sparse import ElectronEventCube
 
 
 def update_real_space_view(self, reset=False):
@@ -44,6 +48,16 @@ def update_real_space_view(self, reset=False):
     if self.datacube is None:
         return
 
+    if (
+        self.time_series is not None
+        and self.datacube.data is not self.time_series.current
+    ):
+        # other data has replaced the time series
+        self.clear_time_series()
+
+    # Electron event data is reduced directly from the event lists
+    sparse = isinstance(self.datacube.data, ElectronEventCube)
+
     # We will branch through certain combinations of detector shape and mode.
     # If we happen across a special case that can be handled directly, we
     # compute vimg. If we encounter a case that needs a more complicated
@@ -62,10 +76,10 @@ def update_real_space_view(self, reset=False):
             f"Diffraction Slice: [{slice_x.start}:{slice_x.stop},{slice_y.start}:{slice_y.stop}]"
         )
 
-        if detector_mode == "Integrating":
-            vimg = np.sum(self.datacube.data[:, :, slice_x, slice_y], axis=(2, 3))
-        elif detector_mode == "Maximum":
-            vimg = np.max(self.datacube.data[:, :, slice_x, slice_y], axis=(2, 3))
+        if detector_mode == "Integrating" and not sparse:
+            vimg = masked_sum(self.datacube.data, (slice_x, slice_y))
+        elif detector_mode == "Maximum" and not sparse:
+            vimg = masked_max(self.datacube.data, (slice_x, slice_y))
         else:
             mask = np.zeros((self.datacube.Q_Nx, self.datacube.Q_Ny), dtype=np.bool_)
             mask[slice_x, slice_y] = True
@@ -125,34 +139,28 @@ def update_real_space_view(self, reset=False):
         if "MASK_DEBUG" in os.environ:
             self.set_diffraction_image(mask.astype(np.float32), reset=reset)
             return
-        mask = mask.astype(np.float32)
-        vimg = np.zeros((self.datacube.R_Nx, self.datacube.R_Ny))
-        iterator = py4DSTEM.tqdmnd(
-            self.datacube.R_Nx,
-            self.datacube.R_Ny,
-            file=StatusBarWriter(self.statusBar()),
-            mininterval=0.1,
-        )
-
+        # Reductions accumulate in the native integer type or float32,
+        # without promoting the data to float64
         if detector_mode == "Integrating":
-            for rx, ry in iterator:
-                vimg[rx, ry] = np.sum(self.datacube.data[rx, ry] * mask)
+            vimg = (
+                self.datacube.data.virtual_image(mask)
+                if sparse
+                else masked_sum(self.datacube.data, mask)
+            )
 
         elif detector_mode == "Maximum":
-            for rx, ry in iterator:
-                vimg[rx, ry] = np.max(self.datacube.data[rx, ry] * mask)
+            vimg = (
+                self.datacube.data.virtual_image_max(mask)
+                if sparse
+                else masked_max(self.datacube.data, mask)
+            )
 
         elif "CoM" in detector_mode:
-            ry_coord, rx_coord = np.meshgrid(
-                np.arange(self.datacube.Q_Ny), np.arange(self.datacube.Q_Nx)
+            CoMx, CoMy = (
+                self.datacube.data.center_of_mass(mask)
+                if sparse
+                else masked_center_of_mass(self.datacube.data, mask)
             )
-            CoMx = np.zeros_like(vimg)
-            CoMy = np.zeros_like(vimg)
-            for rx, ry in iterator:
-                ar = self.datacube.data[rx, ry] * mask
-                tot_intens = np.sum(ar)
-                CoMx[rx, ry] = np.sum(rx_coord * ar) / tot_intens
-                CoMy[rx, ry] = np.sum(ry_coord * ar) / tot_intens
 
             CoMx -= np.mean(CoMx)
             CoMy -= np.mean(CoMy)
@@ -181,6 +189,48 @@ def update_real_space_view(self, reset=False):
     self.set_virtual_image(vimg, reset=reset)
 
 
+def get_virtual_detector_mask(self):
+    """
+    The current virtual detector as a mask for masked_sum and friends: a
+    pair of slices for rectangles and points, otherwise a boolean mask.
+    """
+    detector_shape = self.detector_shape_group.checkedAction().text().replace("&", "")
+    if detector_shape == "Rectangular":
+        slices, _ = self.virtual_detector_roi.getArraySlice(
+            self.datacube.data[0, 0, :, :].T,
+            self.diffraction_space_widget.getImageItem(),
+        )
+        slice_y, slice_x = slices
+        mask = (slice_x, slice_y)
+    elif detector_shape == "Point":
+        y0, x0 = self.virtual_detector_point.saveState()["pos"]
+        xc = np.clip(int(x0 + 1), 0, self.datacube.Q_Nx - 1)
+        yc = np.clip(int(y0 + 1), 0, self.datacube.Q_Ny - 1)
+        mask = (slice(xc, xc + 1), slice(yc, yc + 1))
+    elif detector_shape == "Circle":
+        R = self.virtual_detector_roi.size()[0] / 2.0
+        x0 = self.virtual_detector_roi.pos()[1] + R
+        y0 = self.virtual_detector_roi.pos()[0] + R
+        mask = make_detector(
+            (self.datacube.Q_Nx, self.datacube.Q_Ny), "circle", ((x0, y0), R)
+        )
+    elif detector_shape == "Annulus":
+        R_inner = self.virtual_detector_roi_inner.size()[0] / 2.0
+        x0 = self.virtual_detector_roi_inner.pos()[1] + R_inner
+        y0 = self.virtual_detector_roi_inner.pos()[0] + R_inner
+        R_outer = self.virtual_detector_roi_outer.size()[0] / 2.0
+        if R_inner <= R_outer:
+            R_inner -= 1
+        mask = make_detector(
+            (self.datacube.Q_Nx, self.datacube.Q_Ny),
+            "annulus",
+            ((x0, y0), (R_inner, R_outer)),
+        )
+    else:
+        raise ValueError("Detector shape not recognized")
+    return mask
+
+
 def set_virtual_image(self, vimg, reset=False):
     self.unscaled_realspace_image = vimg
     self._render_virtual_image(reset=reset)
@@ -253,7 +303,7 @@ def _render_virtual_image(self, reset=False):
         self.fft_widget.setImage(
             fft.T, autoLevels=False, levels=levels, autoRange=mode_switch
         )
-        self.fft_widget.getImageItem().setRect(0, 0, fft.shape[1], fft.shape[1])
+        self.fft_widget.setRect(0, 0, fft.shape[1], fft.shape[1])
         if mode_switch:
             # Need to autorange after setRect
             self.fft_widget.autoRange()
@@ -280,7 +330,7 @@ def _render_virtual_image(self, reset=False):
             levels=(0, 1),
         )
 
-        self.fft_widget.getImageItem().setRect(0, 0, fft.shape[1], fft.shape[1])
+        self.fft_widget.setRect(0, 0, fft.shape[1], fft.shape[1])
         if mode_switch:
             # Need to autorange after setRect
             self.fft_widget.autoRange()
@@ -329,8 +379,18 @@ def update_diffraction_space_view(self, reset=False):
             f"Virtual Image: Slice [{slice_x.start}:{slice_x.stop},{slice_y.start}:{slice_y.stop}]"
         )
 
-        if detector_response == "Integrating":
-            DP = np.sum(self.datacube.data[slice_x, slice_y], axis=(0, 1))
+        if isinstance(self.datacube.data, ElectronEventCube):
+            DP = (
+                self.datacube.data.diffraction_sum(slice_x, slice_y)
+                if detector_response == "Integrating"
+                else self.datacube.data.diffraction_max(slice_x, slice_y)
+            )
+        elif detector_response == "Integrating":
+            DP = np.sum(
+                self.datacube.data[slice_x, slice_y],
+                axis=(0, 1),
+                dtype=accumulator_dtype(self.datacube.data.dtype),
+            )
         elif detector_response == "Maximum":
             DP = np.max(self.datacube.data[slice_x, slice_y], axis=(0, 1))
         else:
@@ -1,8 +1,11 @@
 import pyqtgraph as pg
 import numpy as np
+import traceback
+import threading
+import os
 from PyQt5.QtWidgets import QFrame, QPushButton, QApplication, QLabel
 from PyQt5.QtCore import pyqtSignal
-from PyQt5.QtCore import Qt, QObject
+from PyQt5.QtCore import Qt, QObject, QThread
 from PyQt5.QtWidgets import QDialog, QHBoxLayout, QVBoxLayout, QSpinBox
 
 
@@ -19,6 +22,135 @@ class StatusBarWriter:
         pass
 
 
+class TaskCancelled(Exception):
+    pass
+
+
+class BackgroundTask(QThread):
+    """
+    Runs function(task, *args) on a worker thread. The function can report
+    progress with task.report(message), hand intermediate results to the GUI
+    with task.publish(value), and should check task.cancelled (or call
+    task.check_cancelled()) between steps. The result or error is sent
+    back with the succeeded and failed signals, which are delivered on the
+    GUI thread. Functions running in a task must not touch any widgets.
+    """
+
+    progress = pyqtSignal(str)
+    partial = pyqtSignal(object)
+    succeeded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    # the function returned and no call it left running detached is going
+    settled = pyqtSignal()
+
+    def __init__(self, function, *args, parent=None):
+        super().__init__(parent)
+        self.function = function
+        self.args = args
+        self.cancelled = False
+        self.returned = False
+        self.detached = []
+        self.lock = threading.Lock()
+
+    def run(self):
+        try:
+            result = self.function(self, *self.args)
+        except TaskCancelled:
+            return
+        except Exception as err:
+            traceback.print_exc()
+            self.failed.emit(f"{type(err).__name__}: {err}")
+            return
+        finally:
+            # the task outlives the run, but shouldn't keep its data alive
+            self.function = self.args = None
+            with self.lock:
+                self.returned = True
+            self.emit_if_settled()
+        if not self.cancelled:
+            self.succeeded.emit(result)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise TaskCancelled()
+
+    def report(self, message):
+        self.progress.emit(message)
+
+    def publish(self, value):
+        self.partial.emit(value)
+
+    def writer(self):
+        # a file-like object for passing to tqdm
+        return TaskProgressWriter(self)
+
+    def is_settled(self):
+        with self.lock:
+            return self.returned and not self.detached
+
+    def emit_if_settled(self):
+        if self.is_settled():
+            try:
+                self.settled.emit()
+            except RuntimeError:
+                # the task was deleted with the window
+                pass
+
+    def run_detached(self, function, *args, poll_interval=0.1):
+        """
+        Run function(*args) on a daemon thread and wait for its result,
+        checking for cancellation meanwhile. This is for library calls that
+        can't be stopped part way: a cancelled call is abandoned, running to
+        completion with its result discarded, and doesn't keep the app from
+        closing. The task only emits settled once such a call has ended.
+        """
+        result = {}
+
+        def target():
+            try:
+                result["value"] = function(*args)
+            except BaseException as err:
+                result["error"] = err
+            finally:
+                with self.lock:
+                    self.detached.remove(thread)
+                self.emit_if_settled()
+
+        thread = threading.Thread(target=target, daemon=True)
+        with self.lock:
+            self.detached.append(thread)
+        thread.start()
+        while thread.is_alive():
+            self.check_cancelled()
+            thread.join(poll_interval)
+        if "error" in result:
+            raise result["error"]
+        return result["value"]
+
+
+class TaskProgressWriter:
+    """
+    Stands in for StatusBarWriter inside a BackgroundTask: tqdm output is sent
+    to the GUI thread as a progress signal, and writing after the task was
+    cancelled aborts the loop that is reporting.
+    """
+
+    def __init__(self, task):
+        self.task = task
+
+    def write(self, message):
+        self.task.check_cancelled()
+        message = message.strip()
+        if message:
+            self.task.report(message)
+
+    def flush(self):
+        pass
+
+
 class VLine(QFrame):
     # a simple vertical divider line
     def __init__(self):
@@ -124,6 +256,307 @@ def make_detector(shape: tuple, mode: str, geometry) -> np.ndarray:
     return mask
 
 
+def iter_scan_blocks(data, max_bytes=64 * 2**20, row_multiple=1):
+    """
+    Yield (rows, block) pairs covering data in blocks of whole scan rows,
+    where rows is a slice along the first axis and block is that part of data
+    read into an ndarray of about max_bytes at most. Blocks hold a multiple
+    of row_multiple rows, except possibly the last one.
+    """
+    row_bytes = int(np.prod(data.shape[1:])) * np.dtype(data.dtype).itemsize
+    rows_per_block = max(1, max_bytes // (row_bytes * row_multiple)) * row_multiple
+    for start in range(0, data.shape[0], rows_per_block):
+        rows = slice(start, min(start + rows_per_block, data.shape[0]))
+        yield rows, np.asarray(data[rows])
+
+
+def memmap_frames(
+    filepath,
+    dtype,
+    frame_shape,
+    offset=0,
+    frame_header=0,
+    frame_padding=0,
+    n_frames=None,
+) -> np.ndarray:
+    """
+    Map a file of fixed-size frames without copying: after offset bytes, each
+    frame is frame_header bytes of header, the pixels, then frame_padding
+    bytes of padding. Returns a read-only (n_frames, *frame_shape) view that
+    strides over the headers; by default n_frames is as many whole frames as
+    the file holds.
+    """
+    dtype = np.dtype(dtype)
+    record = np.dtype(
+        [
+            ("header", np.uint8, (frame_header,)),
+            ("data", dtype, tuple(frame_shape)),
+            ("padding", np.uint8, (frame_padding,)),
+        ]
+    )
+    if n_frames is None:
+        n_frames = (os.path.getsize(filepath) - offset) // record.itemsize
+    assert n_frames > 0, "File is smaller than one frame"
+    frames = np.memmap(filepath, dtype=record, mode="r", offset=offset, shape=n_frames)
+    return frames["data"]
+
+
+class ScanFrames:
+    """
+    Lazy (Rx, Ry, Qx, Qy) view of a 3D array-like of frames in raster order,
+    for stacks that can't be reshaped in place, such as HDF5 datasets.
+    Indexing it reads only the frames of the requested scan rows, or the
+    single frame of a scan position.
+    """
+
+    def __init__(self, source, scan_shape):
+        assert scan_shape[0] * scan_shape[1] <= source.shape[0], "Too few frames"
+        self.source = source
+        self.shape = (*scan_shape, *source.shape[1:])
+        self.dtype = np.dtype(source.dtype)
+
+    @property
+    def ndim(self):
+        return 4
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def nbytes(self):
+        return self.size * self.dtype.itemsize
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self[...], dtype=dtype)
+
+    def __getitem__(self, key):
+        key = key if isinstance(key, tuple) else (key,)
+        if any(k is Ellipsis for k in key):
+            i = key.index(Ellipsis)
+            key = key[:i] + (slice(None),) * (5 - len(key)) + key[i + 1 :]
+        key = key + (slice(None),) * (4 - len(key))
+        Rx, Ry = self.shape[:2]
+        rows, cols = key[:2]
+
+        if isinstance(rows, (int, np.integer)) and isinstance(cols, (int, np.integer)):
+            frame = range(Rx)[rows] * Ry + range(Ry)[cols]
+            return np.asarray(self.source[(frame, *key[2:])])
+
+        # read the frames of whole scan rows, then apply the rest of the key
+        single_row = isinstance(rows, (int, np.integer))
+        start, stop, step = (
+            slice(rows, rows + 1 if rows != -1 else None) if single_row else rows
+        ).indices(Rx)
+        if stop <= start:
+            block = np.empty((0, *self.shape[1:]), dtype=self.dtype)
+        else:
+            frames = np.asarray(self.source[start * Ry : (stop - 1) * Ry + Ry])
+            block = frames.reshape(-1, *self.shape[1:])[::step]
+        return block[(0 if single_row else slice(None), *key[1:])]
+
+
+def read_region(
+    data,
+    region,
+    scan_bin=1,
+    diffraction_bin=1,
+    reduce="sum",
+    dtype=None,
+    task=None,
+):
+    """
+    Read the part of data selected by region, a tuple of four unit-step
+    slices, combining bins of scan_bin and diffraction_bin pixels by their
+    sum or mean. Each axis is trimmed to a whole number of bins. The region is
+    read in hyperslabs of a few scan rows, so lazy sources only read the data
+    that is kept and the full-resolution array is never held in memory.
+    Returns an array of dtype, by default float32 when binning and the dtype
+    of data otherwise; integer outputs are clipped to their range.
+    """
+    assert reduce in ("sum", "mean"), reduce
+    bins = (scan_bin, scan_bin, diffraction_bin, diffraction_bin)
+    bounds = [s.indices(n)[:2] for s, n in zip(region, data.shape)]
+    bounds = [
+        (start, start + (stop - start) // b * b)
+        for (start, stop), b in zip(bounds, bins)
+    ]
+    out_shape = tuple((stop - start) // b for (start, stop), b in zip(bounds, bins))
+    assert all(n > 0 for n in out_shape), "Region is smaller than the binning"
+
+    binned = scan_bin > 1 or diffraction_bin > 1
+    if dtype is None:
+        dtype = np.float32 if binned else data.dtype
+    out = np.empty(out_shape, dtype=dtype)
+
+    # Sums of integers are exact; means are taken in floating point
+    acc = accumulator_dtype(data.dtype)
+    if reduce == "mean" and acc.kind != "f":
+        acc = np.dtype(np.float32)
+    n_binned = np.prod(bins)
+
+    (x0, x1), (y0, y1), (qx0, qx1), (qy0, qy1) = bounds
+    itemsize = np.dtype(data.dtype).itemsize
+    row_bytes = (y1 - y0) * (qx1 - qx0) * (qy1 - qy0) * itemsize
+    rows_per_block = max(1, 64 * 2**20 // (row_bytes * scan_bin)) * scan_bin
+
+    for start in range(x0, x1, rows_per_block):
+        if task is not None:
+            task.check_cancelled()
+            task.report(f"Reading scan rows {start - x0}/{x1 - x0}")
+        stop = min(start + rows_per_block, x1)
+        block = np.asarray(data[start:stop, y0:y1, qx0:qx1, qy0:qy1])
+        if binned:
+            block = block.reshape(
+                block.shape[0] // scan_bin,
+                scan_bin,
+                block.shape[1] // scan_bin,
+                scan_bin,
+                block.shape[2] // diffraction_bin,
+                diffraction_bin,
+                block.shape[3] // diffraction_bin,
+                diffraction_bin,
+            ).sum(axis=(1, 3, 5, 7), dtype=acc)
+            if reduce == "mean":
+                block /= n_binned
+        if out.dtype.kind in "iu":
+            info = np.iinfo(out.dtype)
+            if block.dtype.kind == "f":
+                block = np.rint(block)
+            block = np.clip(block, info.min, info.max)
+        out[(start - x0) // scan_bin : (stop - x0) // scan_bin] = block
+
+    return out
+
+
+def accumulator_dtype(dtype) -> np.dtype:
+    """
+    Accumulator for reductions over data of the given dtype. Integer counts
+    are summed exactly in 64-bit integers, floating data in float32 (or the
+    data's own precision if that is wider).
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind in "bu":
+        return np.dtype(np.uint64)
+    if dtype.kind == "i":
+        return np.dtype(np.int64)
+    if dtype.kind in "fc":
+        return np.promote_types(dtype, np.float32)
+    return dtype
+
+
+def iter_masked_blocks(data, mask, max_bytes=64 * 2**20):
+    """
+    Yield (rows, pixels) pairs where pixels holds the detector pixels selected
+    by mask for a block of scan rows, flattened along the last axis and in the
+    native dtype of data. mask is a boolean detector mask, or a pair of slices
+    selecting a rectangle. Only the bounding box of the mask is read, as a
+    hyperslab that lazy sources can read directly, and blocks are sized by
+    the bytes of that box.
+    """
+    if isinstance(mask, tuple):
+        box, box_mask = mask, None
+    else:
+        qx, qy = np.nonzero(mask)
+        if qx.size == 0:
+            box = (slice(0, 0), slice(0, 0))
+        else:
+            box = (slice(qx.min(), qx.max() + 1), slice(qy.min(), qy.max() + 1))
+        box_mask = mask[box]
+    box_pixels = np.zeros(data.shape[2:], dtype=np.bool_)[box].size
+
+    row_bytes = data.shape[1] * box_pixels * np.dtype(data.dtype).itemsize
+    rows_per_block = max(1, max_bytes // max(row_bytes, 1))
+    for start in range(0, data.shape[0], rows_per_block):
+        rows = slice(start, min(start + rows_per_block, data.shape[0]))
+        if box_pixels == 0:
+            n_rows = rows.stop - rows.start
+            yield rows, np.zeros((n_rows, data.shape[1], 0), dtype=data.dtype)
+            continue
+        block = np.asarray(data[rows, :, box[0], box[1]])
+        if box_mask is None:
+            yield rows, block.reshape(*block.shape[:2], -1)
+        else:
+            yield rows, block[:, :, box_mask]
+
+
+def masked_sum(data, mask) -> np.ndarray:
+    """Sum of each diffraction pattern over the pixels selected by mask"""
+    out = np.zeros(data.shape[:2], dtype=accumulator_dtype(data.dtype))
+    for rows, pixels in iter_masked_blocks(data, mask):
+        pixels.sum(axis=-1, dtype=out.dtype, out=out[rows])
+    return out
+
+
+def masked_max(data, mask) -> np.ndarray:
+    """Maximum of each diffraction pattern over the pixels selected by mask"""
+    out = np.zeros(data.shape[:2], dtype=data.dtype)
+    for rows, pixels in iter_masked_blocks(data, mask):
+        if pixels.shape[-1] > 0:
+            pixels.max(axis=-1, out=out[rows])
+    return out
+
+
+def masked_center_of_mass(data, mask):
+    """
+    Intensity-weighted mean (qx, qy) detector coordinates of each diffraction
+    pattern over the pixels selected by mask. Patterns with no intensity
+    inside the mask give NaN.
+    """
+    qx, qy = np.indices(data.shape[2:])
+    if isinstance(mask, tuple):
+        qx, qy = qx[mask].ravel(), qy[mask].ravel()
+    else:
+        qx, qy = qx[mask], qy[mask]
+
+    # A floating point matmul, in float32 for data of at most 16 bits, so
+    # that each block is widened by no more than twice its size
+    dtype = np.dtype(data.dtype)
+    if dtype.kind in "fc":
+        acc = np.promote_types(dtype, np.float32)
+    else:
+        acc = np.dtype(np.float32 if dtype.itemsize <= 2 else np.float64)
+    coords = np.stack([np.ones_like(qx), qx, qy], axis=1).astype(acc)
+    moments = np.zeros(data.shape[:2] + (3,), dtype=acc)
+    for rows, pixels in iter_masked_blocks(data, mask):
+        moments[rows] = pixels.astype(acc, copy=False) @ coords
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        CoMx = moments[..., 1] / moments[..., 0]
+        CoMy = moments[..., 2] / moments[..., 0]
+    return CoMx, CoMy
+
+
+def gather_images(data, indices) -> np.ndarray:
+    """
+    Collect the real-space images data[:, :, qx, qy] for each detector pixel
+    (qx, qy) in indices, returned as a float32 stack with the detector pixel
+    along the first axis.
+    """
+    indices = np.asarray(indices)
+    if isinstance(data, np.ndarray):
+        imgs = data[:, :, indices[:, 0], indices[:, 1]]
+        return np.moveaxis(imgs, -1, 0).astype(np.float32)
+
+    # h5py datasets and other lazy arrays do not support paired index arrays
+    return np.stack([data[:, :, qx, qy] for qx, qy in indices]).astype(np.float32)
+
+
+def shift_phase_ramp(freqs, shifts, N: int) -> np.ndarray:
+    """
+    1D Fourier shift factors exp(-2πi q s) for each shift in shifts, evaluated
+    at the frequencies freqs of an axis of length N. The Nyquist term of an
+    even-length axis uses the real part so shifted real images stay real.
+    """
+    ramp = np.exp(-2.0j * np.pi * np.outer(shifts, freqs)).astype(np.complex64)
+    if N % 2 == 0 and freqs.size > N // 2:
+        ramp[:, N // 2] = np.cos(np.pi * np.asarray(shifts))
+    return ramp
+
+
 def complex_to_Lab(
     im, amin=None, amax=None, gamma=1.0, L_scale=100, ab_scale=64, uniform_L=None
 ):
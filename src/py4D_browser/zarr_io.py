@@ -0,0 +1,130 @@
+import zarr
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+import shutil
+from py4D_browser.utils import iter_scan_blocks, TaskCancelled
+
+
+class ConcurrentChunkReader:
+    """
+    Read-only stand-in for a chunked array (such as a zarr Array) that splits
+    every read along the first axis at chunk boundaries and reads the pieces
+    on a pool of threads. Indexing returns ndarrays, so it can be used as the
+    data of a DataCube wherever an h5py Dataset or memory map would be.
+    """
+
+    def __init__(self, array, max_workers=None):
+        self.array = array
+        self.shape = tuple(array.shape)
+        self.dtype = np.dtype(array.dtype)
+        self.ndim = len(self.shape)
+        self.chunks = tuple(array.chunks)
+        self.attrs = array.attrs
+        self.pool = ThreadPoolExecutor(max_workers)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self[...], dtype=dtype)
+
+    def __getitem__(self, key):
+        key = key if isinstance(key, tuple) else (key,)
+        if any(k is Ellipsis for k in key):
+            i = key.index(Ellipsis)
+            key = key[:i] + (slice(None),) * (self.ndim - len(key) + 1) + key[i + 1 :]
+
+        first = key[0] if len(key) > 0 else slice(None)
+        if not isinstance(first, slice) or first.step not in (None, 1):
+            return np.asarray(self.array[key])
+
+        start, stop, _ = first.indices(self.shape[0])
+        step = self.chunks[0]
+        edges = [start, *range((start // step + 1) * step, stop, step), stop]
+        if len(edges) <= 2:
+            return np.asarray(self.array[key])
+
+        pieces = self.pool.map(
+            lambda rows: np.asarray(self.array[(slice(*rows), *key[1:])]),
+            zip(edges[:-1], edges[1:]),
+        )
+        return np.concatenate(list(pieces), axis=0)
+
+
+def find_zarr_arrays(node, N=4, arrays=None):
+    # Traverse a zarr Group and look for Arrays with N dimensions
+    if arrays is None:
+        arrays = []
+    if isinstance(node, zarr.Array):
+        if node.ndim == N:
+            arrays.append(node)
+        return arrays
+    for _, array in node.arrays():
+        find_zarr_arrays(array, N, arrays)
+    for _, group in node.groups():
+        find_zarr_arrays(group, N, arrays)
+    return arrays
+
+
+def open_zarr(filepath, N=4):
+    """
+    Open the zarr store at filepath and return the first N-dimensional array
+    in it, wrapped for concurrent reads, or None if there is none.
+    """
+    arrays = find_zarr_arrays(zarr.open(filepath, mode="r"), N=N)
+    return ConcurrentChunkReader(arrays[0]) if len(arrays) > 0 else None
+
+
+def find_zarr_calibrations(array):
+    # Calibrations as written by write_zarr_array, if present
+    attrs = array.attrs
+    return (
+        attrs.get("R_pixel_size", 1.0),
+        attrs.get("R_pixel_units", "pixels"),
+        attrs.get("Q_pixel_size", 1.0),
+        attrs.get("Q_pixel_units", "pixels"),
+    )
+
+
+def write_zarr_array(task, data, filepath, calibrations):
+    """
+    Write data to a new zarr directory store at filepath, chunked by scan
+    row, with the calibrations stored as attributes. Each block of scan rows
+    is written on a pool of threads, one row per thread. Runs in a
+    BackgroundTask and removes the partial store if the task is cancelled.
+    """
+    frame_bytes = int(np.prod(data.shape[2:])) * np.dtype(data.dtype).itemsize
+    chunks = (
+        1,
+        int(np.clip(4 * 2**20 // frame_bytes, 1, data.shape[1])),
+        *data.shape[2:],
+    )
+    array = zarr.open_array(
+        filepath, mode="w", shape=data.shape, chunks=chunks, dtype=data.dtype
+    )
+    R_size, R_units, Q_size, Q_units = calibrations
+    array.attrs.update(
+        {
+            "R_pixel_size": float(R_size),
+            "R_pixel_units": str(R_units),
+            "Q_pixel_size": float(Q_size),
+            "Q_pixel_units": str(Q_units),
+        }
+    )
+
+    def write_row(row, frames):
+        array[row] = frames
+
+    try:
+        with ThreadPoolExecutor() as pool:
+            for rows, block in iter_scan_blocks(data):
+                task.check_cancelled()
+                list(pool.map(write_row, range(rows.start, rows.stop), block))
+                task.report(f"Writing {filepath}: row {rows.stop}/{data.shape[0]}")
+    except TaskCancelled:
+        shutil.rmtree(filepath, ignore_errors=True)
+        raise
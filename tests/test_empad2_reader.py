@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+empad2 = pytest.importorskip("empad2")
+
+from py4D_browser.empad2_reader import (
+    CALIBRATION_FRAMES,
+    CalibratedEMPAD2,
+    FRAME_SHAPE,
+    split_frame_runs,
+)
+
+
+def write_raw_frames(path, n_frames, rng):
+    # 14 bit analog values, digital counts and gain bits, with the two rows
+    # of metadata that follow each frame
+    analog = rng.integers(0, 2**14, (n_frames, *FRAME_SHAPE), dtype=np.uint32)
+    digital = rng.integers(0, 64, (n_frames, *FRAME_SHAPE), dtype=np.uint32)
+    gain = rng.integers(0, 2, (n_frames, *FRAME_SHAPE), dtype=np.uint32)
+    raw = np.zeros((n_frames, FRAME_SHAPE[0] + 2, FRAME_SHAPE[1]), dtype=np.uint32)
+    raw[:, : FRAME_SHAPE[0]] = analog | (digital << 14) | (gain << 31)
+    raw.tofile(path)
+
+
+@pytest.mark.parametrize("sensor", sorted(empad2.SENSORS))
+def test_calibration_matches_empad2(tmp_path, sensor):
+    rng = np.random.default_rng(0)
+    path = str(tmp_path / "scan_x5_y6.raw")
+    write_raw_frames(path, 30, rng)
+
+    calibrations = empad2.load_calibration_data(sensor=sensor)
+    background = {
+        "even": rng.random(FRAME_SHAPE).astype(np.float32) * 100,
+        "odd": rng.random(FRAME_SHAPE).astype(np.float32) * 100,
+    }
+
+    expected = empad2.load_dataset(path, background, calibrations).data
+    expected = np.asarray(expected).reshape(-1, *FRAME_SHAPE)
+
+    source = CalibratedEMPAD2(path, background, calibrations)
+    assert source.shape == (6, 5, *FRAME_SHAPE)
+    calibrated = np.asarray(source).reshape(-1, *FRAME_SHAPE)
+    np.testing.assert_allclose(calibrated, expected, rtol=1e-5, atol=1e-3)
+
+    # blocks starting on odd frames use the other bank
+    np.testing.assert_allclose(
+        source[1:4].reshape(-1, *FRAME_SHAPE), expected[5:20], rtol=1e-5, atol=1e-3
+    )
+
+
+@pytest.mark.parametrize("rows", [range(0, 4), range(1, 8, 3), range(5, 6)])
+def test_split_frame_runs_covers_rows(rows):
+    Ny = 64
+    runs = split_frame_runs(rows, Ny, 8)
+    frames = np.concatenate([np.arange(first, first + n) for first, _, n in runs])
+    out = np.concatenate([np.arange(i, i + n) for _, i, n in runs])
+    expected = np.concatenate([np.arange(r * Ny, (r + 1) * Ny) for r in rows])
+    np.testing.assert_array_equal(frames, expected)
+    np.testing.assert_array_equal(out, np.arange(len(rows) * Ny))
+    assert all(n <= CALIBRATION_FRAMES for _, _, n in runs)
+    if rows.step == 1:
+        assert len(runs) >= 8
+        assert max(n for _, _, n in runs) - min(n for _, _, n in runs) <= 1
@@ -0,0 +1,63 @@
+import os
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+import pytest
+from PyQt5.QtWidgets import QApplication
+
+from py4D_browser.image_view import LightImageView
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+def pan_to(view, x, y, width):
+    # show a window of the given width (in view units) starting at x, y,
+    # zoomed out far enough to pick a coarse level
+    view.view.setRange(
+        xRange=(x, x + width), yRange=(y, y + width), padding=0, update=True
+    )
+    view.update_tiles()
+
+
+@pytest.mark.parametrize("rect", [None, (-3.0, 2.0, 1.0, 0.82)])
+def test_pan_to_edge_of_non_power_of_two_image(app, rect):
+    nx, ny = 5000, 4100
+    image = np.random.default_rng(0).random((nx, ny), dtype=np.float32)
+    view = LightImageView()
+    view.resize(400, 400)
+    view.show()
+    view.setImage(image)
+    left, top, scale = 0.0, 0.0, 1.0
+    if rect is not None:
+        view.setRect(*rect)
+        left, top, scale = rect[0], rect[1], rect[2] / nx
+
+    for width in (2000, 4000, 8000):
+        # the last few rows, the last few columns, and the far corner
+        for x, y in ((0, ny - 4), (nx - 4, 0), (nx - 4, ny - 4)):
+            pan_to(view, left + x * scale, top + y * scale, width * scale)
+            k, (tx0, tx1, ty0, ty1), _ = view.displayed
+            level = view.get_level(k)
+            assert 0 <= tx0 < tx1 and 0 <= ty0 < ty1
+            assert tx0 * 256 < level.shape[0] and ty0 * 256 < level.shape[1]
+            assert view.imageItem.image.size > 0
+
+    view.close()
+
+
+def test_thin_image_keeps_a_pixel_across(app):
+    # a long, thin image has levels with no pixels along its short side
+    view = LightImageView()
+    view.resize(400, 400)
+    view.show()
+    view.setImage(np.ones((8192, 3), dtype=np.float32))
+    view.view.setRange(xRange=(0, 8192), yRange=(0, 8192), padding=0)
+    view.update_tiles()
+    k, _, _ = view.displayed
+    assert view.get_level(k).shape[1] > 0
+    assert view.imageItem.image.size > 0
+    view.close()